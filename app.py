@@ -4,21 +4,39 @@ from blueprints.stars.stars import stars_bp
 from blueprints.planets.planets import planets_bp
 from blueprints.auth.auth import auth_bp
 from blueprints.logs.logs import logs_bp
+from indexes import ensure_indexes
+from bodies_repository import BodyError, body_error_response
+from blueprints.metrics.metrics import metrics_bp
+from audit import audit_writer
+from metrics import init_metrics
+from json_provider import FastJSONProvider
+from profiling import init_profiling
+from globals import server_timing_header, mongo_reply_bytes
+from signal import signal, SIGINT, SIGTERM
 from sys import exit
 
 app = Flask(__name__)
-CORS(app)
+app.json = FastJSONProvider(app)
+CORS(app, expose_headers=["Link", "X-Query-Index", "Server-Timing", "ETag"])
 app.config["SECRET_KEY"] = "thewitchofcolchis"
 app.register_blueprint(stars_bp)
 app.register_blueprint(planets_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(logs_bp)
+app.register_blueprint(metrics_bp)
+app.register_error_handler(BodyError, body_error_response)
+init_metrics(app, server_timing_header, mongo_reply_bytes)
+init_profiling(app)
+ensure_indexes()
 
 
 def shutdown(signal, frame):
     print("Shutting down...")
+    audit_writer.close()
     exit(0)
 
 
 if __name__ == "__main__":
+    signal(SIGINT, shutdown)
+    signal(SIGTERM, shutdown)
     app.run(debug=True)
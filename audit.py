@@ -0,0 +1,148 @@
+from atexit import register
+from datetime import datetime, UTC
+from queue import Queue, Empty, Full
+from sys import stderr
+from threading import Event, Lock, Thread
+from time import monotonic
+from pymongo.errors import BulkWriteError, PyMongoError
+from globals import (db, audit_batch_size, audit_flush_seconds,
+                     audit_queue_size, audit_put_timeout_seconds,
+                     audit_synchronous)
+from stats import record_logs
+
+logs = db.logs
+
+duplicate_key_code = 11000
+
+action_messages = {
+    "create_star": "created the star",
+    "edit_star": "edited the star",
+    "delete_star": "deleted the star",
+    "add_planet": "added the planet",
+    "edit_planet": "edited the planet",
+    "remove_planet": "removed the planet",
+    "import_stars": "imported"
+}
+
+
+class AuditWriter:
+    def __init__(self, collection, batch_size, flush_seconds, queue_size,
+                 put_timeout_seconds, synchronous):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.put_timeout_seconds = put_timeout_seconds
+        self.synchronous = synchronous
+        self.queue = Queue(maxsize=queue_size)
+        self.stopping = Event()
+        self.thread = None
+        self.lock = Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None and not self.stopping.is_set():
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def write(self, entry):
+        if self.synchronous or self.stopping.is_set():
+            self.store_one(entry)
+            return
+        self.start()
+        try:
+            self.queue.put(entry, timeout=self.put_timeout_seconds)
+        except Full:
+            self.store_one(entry)
+
+    def store_one(self, entry):
+        self.collection.insert_one(entry)
+        record_logs([entry])
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.flush(self.next_batch())
+
+    def next_batch(self):
+        batch = []
+        deadline = monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def flush(self, batch):
+        if not batch:
+            return
+        failed = []
+        try:
+            self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as error:
+            failed = [write_error["index"]
+                      for write_error in error.details["writeErrors"]
+                      if write_error["code"] != duplicate_key_code]
+        except PyMongoError as error:
+            print(f"Failed to write {len(batch)} audit logs: {error}",
+                  file=stderr)
+            failed = list(range(len(batch)))
+
+        written = [entry for i, entry in enumerate(batch) if i not in failed]
+        if written:
+            try:
+                record_logs(written)
+            except PyMongoError as error:
+                print(f"Failed to count {len(written)} audit logs: {error}",
+                      file=stderr)
+        if failed:
+            self.requeue([batch[i] for i in failed])
+
+    def requeue(self, entries):
+        while entries and not self.stopping.is_set():
+            try:
+                self.queue.put_nowait(entries[-1])
+            except Full:
+                break
+            entries.pop()
+        if entries:
+            print(f"Dropped {len(entries)} audit logs", file=stderr)
+        else:
+            self.stopping.wait(self.flush_seconds)
+
+    def close(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+            if len(batch) == self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+
+
+audit_writer = AuditWriter(logs, audit_batch_size, audit_flush_seconds,
+                           audit_queue_size, audit_put_timeout_seconds,
+                           audit_synchronous)
+register(audit_writer.close)
+
+
+def audit(user, action, target, target_ids=None):
+    entry = {
+        "user": user,
+        "time": datetime.now(UTC),
+        "action": action,
+        "message": f"The user {user} {action_messages[action]} {target}"
+    }
+    if target_ids is None:
+        entry["target_id"] = str(target)
+    else:
+        entry["target_ids"] = [str(target_id) for target_id in target_ids]
+    audit_writer.write(entry)
@@ -0,0 +1,77 @@
+from globals import db
+from hashing import hashing_service
+from indexes import ensure_indexes
+from stats import reconcile
+from mongo_scripts.seed_bodies import (generate_batch, generate_logs,
+                                       storage_documents)
+
+collections = ["bodies", "planets", "logs", "users", "stats", "blacklist",
+               "response_cache", "activity_buckets", "log_rollups",
+               "retention"]
+
+bench_users = [
+    {"username": "bench_admin", "password": b"benchadmin", "is_admin": True},
+    {"username": "bench_user", "password": b"benchuser", "is_admin": False}
+]
+
+
+def reset():
+    for name in collections:
+        db.drop_collection(name)
+    ensure_indexes()
+
+
+def seed_users():
+    for user in bench_users:
+        db.users.insert_one({
+            "username": user["username"],
+            "forename": "Bench",
+            "surname": "User",
+            "email": f"{user["username"]}@example.com",
+            "password": hashing_service.hash_password(user["password"]),
+            "is_admin": user["is_admin"]
+        })
+
+
+def seed(num_stars, seed, batch_size=1000, keep=5000):
+    reset()
+    seed_users()
+
+    star_ids, planet_pairs = [], []
+    sample_star, sample_planet = None, None
+
+    for start in range(0, num_stars, batch_size):
+        stars = generate_batch(seed, start,
+                               min(batch_size, num_stars - start))
+        star_documents, planet_documents = storage_documents(stars)
+        db.bodies.insert_many(star_documents, ordered=False)
+        if planet_documents:
+            db.planets.insert_many(planet_documents, ordered=False)
+        entries = generate_logs(stars)
+        if entries:
+            db.logs.insert_many(entries, ordered=False)
+
+        sample_star = sample_star or stars[0]
+        sample_planet = sample_planet or next(
+            (planet for star in stars for planet in star["planets"]), None)
+        if len(star_ids) < keep:
+            star_ids.extend(str(star["_id"]) for star in stars)
+        if len(planet_pairs) < keep:
+            planet_pairs.extend((str(star["_id"]), str(planet["_id"]))
+                                for star in stars
+                                for planet in star["planets"])
+
+    reconcile()
+
+    log_ids = [str(log["_id"]) for log in
+               db.logs.find({}, {"_id": 1}).sort("_id", 1).limit(keep)]
+
+    return {
+        "star_ids": star_ids[:keep],
+        "planet_pairs": planet_pairs[:keep],
+        "log_ids": log_ids,
+        "sample_star": sample_star,
+        "sample_planet": sample_planet,
+        "usernames": sorted({entry["user"] for entry in
+                             db.logs.find({}, {"user": 1}).limit(keep)})
+    }
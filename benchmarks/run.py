@@ -0,0 +1,244 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+from json import dump, load
+from os import environ
+from platform import python_version
+from statistics import quantiles
+from sys import exit
+from threading import local
+from time import perf_counter
+from pymongo import monitoring
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.local = local()
+
+    def started(self, event):
+        self.local.count = getattr(self.local, "count", 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def take(self):
+        count = getattr(self.local, "count", 0)
+        self.local.count = 0
+        return count
+
+
+round_trips = RoundTripCounter()
+
+
+def use_mongomock():
+    import pymongo
+    from mongomock import MongoClient
+    from mongomock.database import Database
+    from pymongo.errors import OperationFailure
+
+    command = Database.command
+
+    def mocked_command(self, *args, **kwargs):
+        try:
+            return command(self, *args, **kwargs)
+        except NotImplementedError as error:
+            raise OperationFailure(str(error))
+
+    Database.command = mocked_command
+    client = MongoClient()
+    pymongo.MongoClient = lambda *args, **kwargs: client
+
+
+def load_app(mongo_uri, db_name):
+    environ["MONGO_DB"] = db_name
+    if mongo_uri.startswith("mongomock://"):
+        use_mongomock()
+    else:
+        environ["MONGO_URI"] = mongo_uri
+        monitoring.register(round_trips)
+
+    from app import app
+    app.logger.disabled = True
+    return app
+
+
+def measure(app, build, indexes, concurrency):
+    clients = local()
+
+    def send(i):
+        if not hasattr(clients, "client"):
+            clients.client = app.test_client()
+        request = build(i)
+        round_trips.take()
+        started = perf_counter()
+        response = clients.client.open(
+            request["path"], method=request.get("method", "GET"),
+            data=request.get("data"), headers=request.get("headers"))
+        response.get_data()
+        elapsed = perf_counter() - started
+        return elapsed, round_trips.take(), response.status_code
+
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(send, indexes))
+    return samples, perf_counter() - started
+
+
+def summarise(samples, duration, count_round_trips):
+    latencies = [elapsed * 1000 for elapsed, _, _ in samples]
+    cuts = quantiles(latencies, n=100, method="inclusive")
+    statuses = {}
+    for _, _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    result = {
+        "requests": len(samples),
+        "throughput": round(len(samples) / duration, 2),
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "round_trips": None,
+        "statuses": statuses
+    }
+    if count_round_trips:
+        result["round_trips"] = round(
+            sum(trips for _, trips, _ in samples) / len(samples), 2)
+    return result
+
+
+def run(args):
+    app = load_app(args.mongo_uri, args.db_name)
+
+    from benchmarks.dataset import seed
+    from benchmarks.scenarios import build_scenarios
+    from globals import planet_storage
+
+    per_route = args.warmup + args.requests
+    dataset = seed(args.stars, args.seed)
+    shortest = min(len(dataset["star_ids"]), len(dataset["planet_pairs"]),
+                   len(dataset["log_ids"])) - 1
+    if shortest < per_route:
+        exit(f"--stars {args.stars} is too small for {per_route} requests "
+             "per route")
+
+    count_round_trips = not args.mongo_uri.startswith("mongomock://")
+    results = {}
+
+    for name, build in build_scenarios(dataset, per_route):
+        if args.routes and not any(fnmatch(name, pattern)
+                                   for pattern in args.routes):
+            continue
+        warmup, _ = measure(app, build, range(args.warmup), args.concurrency)
+        server_errors = sorted({status for _, _, status in warmup
+                                if status >= 500})
+        if server_errors:
+            exit(f"{name} returned {server_errors} during warmup")
+        samples, duration = measure(app, build,
+                                    range(args.warmup, per_route),
+                                    args.concurrency)
+        results[name] = summarise(samples, duration, count_round_trips)
+        print_result(name, results[name])
+
+    return {
+        "settings": {
+            "stars": args.stars,
+            "seed": args.seed,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "backend": args.mongo_uri.split("://")[0],
+            "planet_storage": planet_storage,
+            "python": python_version()
+        },
+        "routes": results
+    }
+
+
+def print_result(name, result):
+    round_trips = result["round_trips"]
+    print(f"{name:<24} {result["throughput"]:>9.1f} req/s  "
+          f"p50 {result["p50_ms"]:>8.2f}  p95 {result["p95_ms"]:>8.2f}  "
+          f"p99 {result["p99_ms"]:>8.2f} ms  "
+          f"trips {"-" if round_trips is None else round_trips}  "
+          f"{result["statuses"]}")
+
+
+def failure_share(result):
+    failures = sum(count for status, count in result["statuses"].items()
+                   if not status.startswith("2"))
+    return round(failures / result["requests"], 3)
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+
+    for name, result in current["routes"].items():
+        server_errors = sum(count for status, count
+                            in result["statuses"].items()
+                            if status.startswith("5"))
+        if server_errors:
+            regressions.append(f"{name}: {server_errors} server errors")
+
+        previous = baseline["routes"].get(name)
+        if previous is None:
+            continue
+        if failure_share(result) != failure_share(previous):
+            regressions.append(f"{name}: non-2xx share "
+                               f"{failure_share(previous)} -> "
+                               f"{failure_share(result)}")
+        if result["p95_ms"] > previous["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {previous["p95_ms"]} ms -> "
+                               f"{result["p95_ms"]} ms")
+        if result["throughput"] < previous["throughput"] * (1 - threshold):
+            regressions.append(f"{name}: throughput "
+                               f"{previous["throughput"]} -> "
+                               f"{result["throughput"]} req/s")
+        if None not in (result["round_trips"], previous["round_trips"]) \
+                and result["round_trips"] > previous["round_trips"]:
+            regressions.append(f"{name}: round trips "
+                               f"{previous["round_trips"]} -> "
+                               f"{result["round_trips"]}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Benchmark every API route against a seeded dataset")
+    parser.add_argument("--mongo-uri", default="mongomock://",
+                        help="mongomock:// runs in process, otherwise a "
+                             "mongodb:// URI for a local mongod")
+    parser.add_argument("--db-name", default="EDB_BENCH")
+    parser.add_argument("--stars", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--routes", nargs="*",
+                        help="only run routes matching these patterns, "
+                             "e.g. \"stars.*\"")
+    parser.add_argument("--output", help="save the results as a baseline")
+    parser.add_argument("--compare",
+                        help="fail if a route regressed from this baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed p95/throughput change (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    current = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            dump(current, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            regressions = compare(load(file), current, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            exit(1)
+
+    exit(0)
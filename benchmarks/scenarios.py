@@ -0,0 +1,136 @@
+from base64 import b64encode
+from datetime import datetime, UTC, timedelta
+from json import dumps
+from uuid import uuid4
+from jwt import encode
+from globals import secret_key
+from schemas import star_fields, planet_fields
+
+
+def make_token(username, is_admin):
+    return encode({
+        "user": username, "is_admin": is_admin, "jti": uuid4().hex,
+        "exp": datetime.now(UTC) + timedelta(hours=6)},
+        secret_key, algorithm="HS256")
+
+
+def basic_auth(username, password):
+    credentials = b64encode(f"{username}:{password}".encode("utf-8"))
+    return {"Authorization": f"Basic {credentials.decode("ascii")}"}
+
+
+def form_values(document, fields):
+    return {field: str(convert(document[field]))
+            for field, convert in fields.items()}
+
+
+def build_scenarios(dataset, per_route):
+    admin = {"x-access-token": make_token("bench_admin", True)}
+    user = {"x-access-token": make_token("bench_user", False)}
+
+    star_ids = dataset["star_ids"]
+    planet_pairs = dataset["planet_pairs"]
+    log_ids = dataset["log_ids"]
+    username = dataset["usernames"][0]
+
+    star_form = form_values(dataset["sample_star"], star_fields)
+    planet_form = form_values(dataset["sample_planet"], planet_fields)
+
+    s_id = star_ids[0]
+    p_s_id, p_id = planet_pairs[0]
+    ids = ",".join(star_ids[:50])
+    p_ids = ",".join(pair[1] for pair in planet_pairs[:50])
+
+    doomed_stars = star_ids[:0:-1]
+    doomed_planets = planet_pairs[1:]
+    logout_tokens = [make_token("bench_user", False)
+                     for i in range(per_route)]
+    bulk_body = "\n".join(dumps({**star_form, "planets": [planet_form]})
+                          for i in range(100))
+
+    return [
+        ("stars.list", lambda i: {
+            "path": "/api/v1.0/bodies?ps=20"}),
+        ("stars.list_filtered", lambda i: {
+            "path": "/api/v1.0/bodies?spectral_classification=G"
+                    "&min_distance=50&sort=-distance&ps=20"}),
+        ("stars.list_page", lambda i: {
+            "path": f"/api/v1.0/bodies?pn={i % 20 + 1}&ps=20"}),
+        ("stars.multi_get", lambda i: {
+            "path": f"/api/v1.0/bodies?ids={ids}"}),
+        ("stars.count", lambda i: {
+            "path": "/api/v1.0/bodies/num_of_stars"}),
+        ("stars.get", lambda i: {
+            "path": f"/api/v1.0/bodies/{star_ids[i % len(star_ids)]}"
+                    "?show_planets=true"}),
+        ("stars.cache_stats", lambda i: {
+            "path": "/api/v1.0/bodies/cache_stats", "headers": admin}),
+        ("stars.add", lambda i: {
+            "method": "POST", "path": "/api/v1.0/bodies",
+            "data": star_form, "headers": admin}),
+        ("stars.bulk_add", lambda i: {
+            "method": "POST", "path": "/api/v1.0/bodies/bulk",
+            "data": bulk_body, "headers": admin}),
+        ("stars.modify", lambda i: {
+            "method": "PUT", "path": f"/api/v1.0/bodies/{s_id}",
+            "data": star_form, "headers": admin}),
+        ("planets.list", lambda i: {
+            "path": f"/api/v1.0/bodies/{p_s_id}/planets"}),
+        ("planets.multi_get", lambda i: {
+            "path": f"/api/v1.0/bodies/planets?ids={p_ids}"}),
+        ("planets.count", lambda i: {
+            "path": "/api/v1.0/bodies/num_of_planets"}),
+        ("planets.get", lambda i: {
+            "path": "/api/v1.0/bodies/{0}/planets/{1}".format(
+                *planet_pairs[i % len(planet_pairs)])}),
+        ("planets.add", lambda i: {
+            "method": "POST", "path": f"/api/v1.0/bodies/{s_id}/planets",
+            "data": planet_form, "headers": user}),
+        ("planets.modify", lambda i: {
+            "method": "PUT",
+            "path": f"/api/v1.0/bodies/{p_s_id}/planets/{p_id}",
+            "data": planet_form, "headers": admin}),
+        ("planets.remove", lambda i: {
+            "method": "DELETE",
+            "path": "/api/v1.0/bodies/{0}/planets/{1}".format(
+                *doomed_planets[i]), "headers": admin}),
+        ("stars.remove", lambda i: {
+            "method": "DELETE", "path": f"/api/v1.0/bodies/{doomed_stars[i]}",
+            "headers": admin}),
+        ("auth.register", lambda i: {
+            "method": "POST", "path": "/api/v1.0/register", "data": {
+                "username": f"bench_{i}", "forename": "Bench",
+                "surname": "User", "email": f"bench_{i}@example.com",
+                "password": "benchpassword"}}),
+        ("auth.register_admin", lambda i: {
+            "method": "POST", "path": "/api/v1.0/register_admin", "data": {
+                "username": f"bench_admin_{i}", "forename": "Bench",
+                "surname": "Admin", "email": f"bench_admin_{i}@example.com",
+                "password": "benchpassword"}, "headers": admin}),
+        ("auth.login", lambda i: {
+            "path": "/api/v1.0/login",
+            "headers": basic_auth("bench_user", "benchuser")}),
+        ("auth.accounts", lambda i: {
+            "path": "/api/v1.0/accounts", "headers": admin}),
+        ("auth.account", lambda i: {
+            "path": "/api/v1.0/accounts/bench_user", "headers": admin}),
+        ("auth.token_cache", lambda i: {
+            "path": "/api/v1.0/token_cache", "headers": admin}),
+        ("auth.remove_account", lambda i: {
+            "method": "DELETE", "path": f"/api/v1.0/accounts/bench_{i}",
+            "headers": admin}),
+        ("auth.logout", lambda i: {
+            "path": "/api/v1.0/logout",
+            "headers": {"x-access-token": logout_tokens[i]}}),
+        ("logs.list", lambda i: {
+            "path": "/api/v1.0/logs?ps=20", "headers": admin}),
+        ("logs.all", lambda i: {
+            "path": "/api/v1.0/all_logs", "headers": admin}),
+        ("logs.user_activity", lambda i: {
+            "path": "/api/v1.0/logs/user_activity", "headers": admin}),
+        ("logs.by_user", lambda i: {
+            "path": f"/api/v1.0/logs/{username}?ps=20", "headers": admin}),
+        ("logs.remove", lambda i: {
+            "method": "DELETE", "path": f"/api/v1.0/logs/{log_ids[i]}",
+            "headers": admin})
+    ]
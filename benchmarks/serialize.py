@@ -0,0 +1,49 @@
+from argparse import ArgumentParser
+from copy import deepcopy
+from timeit import repeat
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from json_provider import FastJSONProvider
+from mongo_scripts.seed_bodies import generate_batch
+
+
+def stringify_ids(stars):
+    for star in stars:
+        star["_id"] = str(star["_id"])
+        for planet in star["planets"]:
+            planet["_id"] = str(planet["_id"])
+    return stars
+
+
+def best_of(func, number, repeats):
+    return min(repeat(func, number=number, repeat=repeats)) / number * 1000
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Compare JSON serialisation of a page of stars")
+    parser.add_argument("--stars", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--number", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+    stars = generate_batch(args.seed, 0, args.stars)
+    planets = sum(len(star["planets"]) for star in stars)
+
+    with app.app_context():
+        default_ms = best_of(
+            lambda: default_provider.dumps(stringify_ids(deepcopy(stars))),
+            args.number, args.repeat)
+        copy_ms = best_of(lambda: deepcopy(stars), args.number, args.repeat)
+        fast_ms = best_of(lambda: fast_provider.dumps(stars), args.number,
+                          args.repeat)
+
+    default_ms -= copy_ms
+    print(f"{args.stars} stars, {planets} planets")
+    print(f"str() loops + default provider: {default_ms:8.2f} ms")
+    print(f"FastJSONProvider:               {fast_ms:8.2f} ms")
+    print(f"speedup:                        {default_ms / fast_ms:8.1f}x")
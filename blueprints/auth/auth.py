@@ -1,13 +1,30 @@
-from flask import Blueprint, request, make_response, jsonify
+from flask import Blueprint, request, make_response, jsonify, g
 from datetime import datetime, UTC, timedelta
+from uuid import uuid4
 from jwt import encode
-from bcrypt import checkpw, gensalt, hashpw
+from pymongo.errors import DuplicateKeyError
 from decorators import jwt_required, admin_required
+from hashing import hashing_service, HashingBusy
 from globals import db, secret_key
+from revocation import revocations
+from token_cache import claims_cache
+from streaming import wants_ndjson, ndjson_response
 
 auth_bp = Blueprint("auth_bp", __name__)
 users = db.users
-blacklist = db.blacklist
+
+
+def duplicate_user_response(error):
+    key_pattern = (error.details or {}).get("keyPattern", {})
+    field = "email" if "email" in key_pattern else "username"
+    return make_response(jsonify({"error": f"{field} already exists"}), 400)
+
+
+def hashing_busy_response():
+    response = make_response(
+        jsonify({"error": "server busy, please try again shortly"}), 503)
+    response.headers["Retry-After"] = "1"
+    return response
 
 
 @auth_bp.route("/api/v1.0/register", methods=["POST"])
@@ -27,15 +44,10 @@ def register():
     surname = request.form["surname"]
     password = request.form["password"].encode("utf-8")
 
-    if users.find_one({"username": username}):
-        return make_response(
-            jsonify({"error": "username already exists"}), 400)
-
-    if users.find_one({"email": email}):
-        return make_response(
-            jsonify({"error": "email already exists"}), 400)
-
-    password = hashpw(password, gensalt())
+    try:
+        password = hashing_service.hash_password(password)
+    except HashingBusy:
+        return hashing_busy_response()
 
     user_to_add = {
         "username": username,
@@ -46,7 +58,10 @@ def register():
         "is_admin": False
     }
 
-    users.insert_one(user_to_add)
+    try:
+        users.insert_one(user_to_add)
+    except DuplicateKeyError as error:
+        return duplicate_user_response(error)
 
     return make_response(
         jsonify({"message": "account registration successful"}), 201)
@@ -71,15 +86,10 @@ def register_admin():
     surname = request.form["surname"]
     password = request.form["password"].encode("utf-8")
 
-    if users.find_one({"username": username}):
-        return make_response(
-            jsonify({"error": "username already exists"}), 400)
-
-    if users.find_one({"email": email}):
-        return make_response(
-            jsonify({"error": "email already exists"}), 400)
-
-    password = hashpw(password, gensalt())
+    try:
+        password = hashing_service.hash_password(password)
+    except HashingBusy:
+        return hashing_busy_response()
 
     user_to_add = {
         "username": username,
@@ -90,7 +100,10 @@ def register_admin():
         "is_admin": True
     }
 
-    users.insert_one(user_to_add)
+    try:
+        users.insert_one(user_to_add)
+    except DuplicateKeyError as error:
+        return duplicate_user_response(error)
 
     return make_response(
         jsonify({"message": "admin account registration successful"}), 201)
@@ -110,12 +123,28 @@ def login():
         return make_response(
             jsonify({"message": "incorrect username"}), 401)
 
-    if not checkpw(bytes(auth.password, "UTF-8"), user["password"]):
+    password = bytes(auth.password, "UTF-8")
+
+    try:
+        password_matches = hashing_service.check_password(
+            password, user["password"])
+    except HashingBusy:
+        return hashing_busy_response()
+
+    if not password_matches:
         return make_response(
             jsonify({"message": "incorrect password"}), 401)
 
+    if hashing_service.needs_rehash(user["password"]):
+        try:
+            users.update_one({"_id": user["_id"]}, {"$set": {
+                "password": hashing_service.hash_password(password)}})
+        except HashingBusy:
+            pass
+
     token = encode({
         "user": auth.username, "is_admin": user["is_admin"],
+        "jti": uuid4().hex,
         "exp": datetime.now(UTC) + timedelta(minutes=60)},
         secret_key, algorithm="HS256")
 
@@ -125,34 +154,35 @@ def login():
 @auth_bp.route("/api/v1.0/logout", methods=["GET"])
 @jwt_required
 def logout():
-    token = request.headers["x-access-token"]
-    blacklist.insert_one({"token": token})
+    revocations.revoke(g.token_claims["jti"], g.token_claims["exp"])
     return make_response(jsonify({"message": "logout successful"}), 200)
 
 
+@auth_bp.route("/api/v1.0/token_cache", methods=["GET"])
+@jwt_required
+@admin_required
+def token_cache_stats():
+    return make_response(jsonify(claims_cache.stats()), 200)
+
+
 @auth_bp.route("/api/v1.0/accounts", methods=["GET"])
 @jwt_required
 @admin_required
 def get_all_accounts():
-    data_to_return = []
-    users_cursor = users.find()
+    users_cursor = users.find({}, {"password": 0})
 
-    for user in users_cursor:
-        user["_id"] = str(user["_id"])
-        user.pop("password", None)
-        data_to_return.append(user)
+    if wants_ndjson():
+        return ndjson_response(users_cursor)
 
-    return make_response(jsonify(data_to_return), 200)
+    return make_response(jsonify(list(users_cursor)), 200)
 
 
 @auth_bp.route("/api/v1.0/accounts/<string:username>", methods=["GET"])
 @jwt_required
 def get_account_by_username(username):
-    user = users.find_one({"username": username})
+    user = users.find_one({"username": username}, {"password": 0})
     if user is None:
         return make_response(jsonify({"error": "user not found"}), 404)
-    user.pop("password", None)
-    user["_id"] = str(user["_id"])
 
     return make_response(jsonify(user), 200)
 
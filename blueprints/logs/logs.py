@@ -1,12 +1,44 @@
 from flask import Blueprint, make_response, request, jsonify
 from decorators import jwt_required, admin_required
 from bson import ObjectId
-from globals import db
+from datetime import datetime, UTC
+from globals import db, activity_windows
+from pagination import add_next_link, decode_cursor
+from streaming import wants_ndjson, ndjson_response
+from stats import (record_logs, reset_log_counters, read_log_actions,
+                   read_activity)
+from indexes import ensure_indexes
+from retention import (find_logs, archived_logs, count_archived,
+                       clear_archives)
+from feeds import sse_response
 
 logs_bp = Blueprint("logs_bp", __name__)
 logs = db.logs
 
 
+def parse_time(value):
+    time = datetime.fromisoformat(value)
+    if time.tzinfo is not None:
+        time = time.astimezone(UTC).replace(tzinfo=None)
+    return time
+
+
+def log_filters():
+    query = {}
+    time_range = {}
+
+    if request.args.get("since"):
+        time_range["$gte"] = parse_time(request.args.get("since"))
+    if request.args.get("until"):
+        time_range["$lt"] = parse_time(request.args.get("until"))
+    if time_range:
+        query["time"] = time_range
+    if request.args.get("action"):
+        query["action"] = request.args.get("action")
+
+    return query
+
+
 @logs_bp.route("/api/v1.0/logs", methods=["GET"])
 @jwt_required
 @admin_required
@@ -20,43 +52,75 @@ def query_all_logs():
 
     page_start = (page_size * (page_num - 1))
 
-    data_to_return = []
-    logs_cursor = logs.find().skip(page_start).limit(page_size)
+    try:
+        query = log_filters()
+    except ValueError:
+        return make_response(jsonify({"error": "invalid time filter"}), 400)
 
-    for log in logs_cursor:
-        log["_id"] = str(log["_id"])
-        data_to_return.append(log)
+    sort_keys = [("time", 1), ("_id", 1)]
 
-    return make_response(jsonify(data_to_return), 200)
+    after = None
+    if request.args.get("after"):
+        after = decode_cursor(request.args.get("after"), len(sort_keys))
+        if after is None:
+            return make_response(jsonify({"error": "invalid cursor"}), 400)
+        page_start = 0
+
+    data_to_return = find_logs(query, after, page_start, page_size)
+
+    response = make_response(jsonify(data_to_return), 200)
+
+    if data_to_return and len(data_to_return) == page_size:
+        add_next_link(response, [data_to_return[-1]["time"],
+                                 data_to_return[-1]["_id"]])
+
+    return response
 
 
 @logs_bp.route("/api/v1.0/all_logs", methods=["GET"])
 @jwt_required
 @admin_required
 def logs_no_pagination():
-
-    data_to_return = []
     logs_cursor = logs.find()
 
-    for log in logs_cursor:
-        log["_id"] = str(log["_id"])
-        data_to_return.append(log)
+    if wants_ndjson():
+        return ndjson_response(logs_cursor, archived_logs())
 
-    return make_response(jsonify(data_to_return), 200)
+    return make_response(jsonify(list(logs_cursor)), 200)
 
 
-@logs_bp.route("/api/v1.0/logs/user_activity", methods=["GET"])
+@logs_bp.route("/api/v1.0/logs/stream", methods=["GET"])
 @jwt_required
 @admin_required
-def user_activity():
+def stream_logs():
+    return sse_response(request.headers.get("Last-Event-ID"))
 
-    agr_pipeline = [
-        {"$group": {"_id": "$user", "count": {"$sum": 1}}}
-    ]
 
-    agr_return = logs.aggregate(agr_pipeline)
-
-    data_to_return = {item["_id"]: item["count"] for item in agr_return}
+@logs_bp.route("/api/v1.0/logs/user_activity", methods=["GET"])
+@jwt_required
+@admin_required
+def user_activity():
+    top = None
+
+    if request.args.get("top"):
+        top = request.args.get("top")
+        if not top.isdigit() or int(top) == 0:
+            return make_response(
+                jsonify({"error": "top must be a positive integer"}), 400)
+        top = int(top)
+
+    if request.args.get("window"):
+        window = request.args.get("window")
+        if window not in activity_windows:
+            return make_response(jsonify({
+                "error": f"window must be one of "
+                         f"{", ".join(activity_windows)}"}), 400)
+        since, users = read_activity(window, top)
+        return make_response(jsonify({"window": window, "since": since,
+                                      "users": users}), 200)
+
+    data_to_return = {counter["user"]: counter["count"]
+                      for counter in read_log_actions(top)}
 
     return make_response(jsonify(data_to_return), 200)
 
@@ -74,17 +138,34 @@ def query_logs_by_user(username):
 
     page_start = (page_size * (page_num - 1))
 
-    user_logs = list(logs.find({"user": username}).skip(
-        page_start).limit(page_size))
+    try:
+        query = {"user": username, **log_filters()}
+    except ValueError:
+        return make_response(jsonify({"error": "invalid time filter"}), 400)
+
+    sort_keys = [("time", 1), ("_id", 1)]
+
+    after = None
+    if request.args.get("after"):
+        after = decode_cursor(request.args.get("after"), len(sort_keys))
+        if after is None:
+            return make_response(jsonify({"error": "invalid cursor"}), 400)
+        page_start = 0
+
+    user_logs = find_logs(query, after, page_start, page_size)
 
     if not user_logs:
         return make_response(
             jsonify({"error": "no logs contain the supplied username"}), 404)
 
-    for log in user_logs:
-        log["_id"] = str(log["_id"])
+    last_key = [user_logs[-1]["time"], user_logs[-1]["_id"]]
+
+    response = make_response(jsonify(user_logs), 200)
 
-    return make_response(jsonify(user_logs), 200)
+    if len(user_logs) == page_size:
+        add_next_link(response, last_key)
+
+    return response
 
 
 @logs_bp.route("/api/v1.0/logs/<string:l_id>", methods=["DELETE"])
@@ -94,29 +175,31 @@ def remove_log(l_id):
     if not ObjectId.is_valid(l_id):
         return make_response(jsonify({"error": "invalid log ID"}), 400)
 
-    if logs.find_one({"_id": ObjectId(l_id)}) is None:
+    log = logs.find_one_and_delete({"_id": ObjectId(l_id)},
+                                   {"user": 1, "action": 1, "time": 1})
+
+    if log is None:
         return make_response(jsonify({"error": "log ID does not exist"}), 404)
 
-    result = logs.delete_one({"_id": ObjectId(l_id)})
+    record_logs([log], -1)
 
-    if result.deleted_count == 1:
-        return make_response(
-            jsonify({"message": "log deleted successfully"}), 200)
-    else:
-        return make_response(
-            jsonify({"error": "deletion attempt failed"}), 500)
+    return make_response(
+        jsonify({"message": "log deleted successfully"}), 200)
 
 
 @logs_bp.route("/api/v1.0/logs", methods=["DELETE"])
 @jwt_required
 @admin_required
 def remove_logs():
-    number_of_logs = logs.count_documents({})
+    number_of_logs = logs.estimated_document_count() + count_archived()
 
     if number_of_logs == 0:
         return make_response(
             jsonify({"message": "the logs collection is already empty"}), 200)
 
-    result = logs.delete_many({})
+    logs.drop()
+    ensure_indexes(collections=["logs"])
+    clear_archives()
+    reset_log_counters()
     return make_response(
-        jsonify({"message": f"{result.deleted_count} logs deleted"}), 200)
+        jsonify({"message": f"{number_of_logs} logs deleted"}), 200)
@@ -0,0 +1,31 @@
+from flask import Blueprint, make_response
+from decorators import jwt_required, admin_required
+from metrics import registry, help_texts
+from response_cache import response_cache
+from token_cache import claims_cache
+
+metrics_bp = Blueprint("metrics_bp", __name__)
+
+
+@metrics_bp.route("/api/v1.0/metrics", methods=["GET"])
+@jwt_required
+@admin_required
+def metrics():
+    claims = claims_cache.stats()
+    responses = response_cache.stats()
+
+    body = registry.render(help_texts, [
+        ("edb_claims_cache_hits_total", "counter", claims["hits"]),
+        ("edb_claims_cache_misses_total", "counter", claims["misses"]),
+        ("edb_claims_cache_entries", "gauge", claims["size"]),
+        ("edb_response_cache_hits_total", "counter", responses["hits"]),
+        ("edb_response_cache_misses_total", "counter", responses["misses"]),
+        ("edb_response_cache_entries", "gauge", responses.get("entries")),
+        ("edb_response_cache_bytes", "gauge", responses.get("bytes")),
+        ("edb_response_cache_evictions_total", "counter",
+         responses.get("evictions"))
+    ])
+
+    response = make_response(body, 200)
+    response.headers["Content-Type"] = "text/plain; version=0.0.4"
+    return response
@@ -1,58 +1,64 @@
 from flask import Blueprint, make_response, request, jsonify, g
 from bson import ObjectId
 from decorators import jwt_required, admin_required
-from datetime import datetime
-from globals import db
+from audit import audit
+from response_cache import response_cache
+from etags import conditional_get, if_match_versions
+from bodies_repository import (count_planets, find_planets, find_planet_view,
+                               find_planets_by_ids, push_planet, update_planet,
+                               pull_planet)
+from globals import max_multi_get_ids
+from schemas import missing_fields, planet_fields, build_planet
 
 planets_bp = Blueprint("planets_bp", __name__)
-bodies = db.bodies
-logs = db.logs
 
 
 @planets_bp.route("/api/v1.0/bodies/<string:s_id>/planets", methods=["GET"])
+@conditional_get
+@response_cache.cached("star:{s_id}")
 def query_all_planets(s_id):
     if not ObjectId.is_valid(s_id):
         return make_response(jsonify({"error": "invalid star ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
-
     convert_units = False
 
     if request.args.get("convert_units"):
         convert_units = request.args.get("convert_units").title()
 
-    data_to_return = []
-    body = bodies.find_one({"_id": ObjectId(s_id)}, {"planets": 1, "_id": 0})
+    data_to_return = find_planets(s_id, convert_units)
 
-    for planet in body["planets"]:
-        planet["_id"] = str(planet["_id"])
+    return make_response(jsonify(data_to_return), 200)
 
-        if convert_units:
-            planet["mass"] *= 5.97e24
-            planet["surface_temperature"] -= 273
 
-        data_to_return.append(planet)
+@planets_bp.route("/api/v1.0/bodies/planets", methods=["GET"])
+def query_planets_by_ids():
+    convert_units = False
 
-    return make_response(jsonify(data_to_return), 200)
+    if request.args.get("convert_units"):
+        convert_units = request.args.get("convert_units").title()
 
+    ids = [i for i in request.args.get("ids", "").split(",") if i]
 
-@planets_bp.route("/api/v1.0/bodies/num_of_planets", methods=["GET"])
-def number_of_planets():
-    agr_pipeline = [
-        {"$match": {"type": "star"}},
-        {"$unwind": "$planets"},
-        {"$match": {"planets.type": "planet"}},
-        {"$count": "Number of planets"}
-    ]
+    if not ids:
+        return make_response(jsonify({"error": "missing fields: ids"}), 400)
+
+    if len(ids) > max_multi_get_ids:
+        return make_response(jsonify(
+            {"error": f"at most {max_multi_get_ids} IDs per request"}), 400)
 
-    agr_return = list(bodies.aggregate(agr_pipeline))
+    return make_response(jsonify(find_planets_by_ids(ids, convert_units)), 200)
 
-    return make_response(jsonify(agr_return), 200)
+
+@planets_bp.route("/api/v1.0/bodies/num_of_planets", methods=["GET"])
+@response_cache.cached("planet_count")
+def number_of_planets():
+    return make_response(jsonify(count_planets()), 200)
 
 
 @planets_bp.route("/api/v1.0/bodies/<string:s_id>/planets/<string:p_id>",
                   methods=["GET"])
+@conditional_get
+@response_cache.cached("star:{s_id}")
 def query_one_planet(s_id, p_id):
     if not ObjectId.is_valid(s_id):
         return make_response(jsonify({"error": "invalid star ID"}), 400)
@@ -60,29 +66,14 @@ def query_one_planet(s_id, p_id):
     if not ObjectId.is_valid(p_id):
         return make_response(jsonify({"error": "invalid planet ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
-
-    if bodies.find_one({"_id": ObjectId(s_id),
-                        "planets._id": ObjectId(p_id)}) is None:
-        return make_response(
-            jsonify({"error": "planet ID does not exist"}), 404)
-
     convert_units = False
 
     if request.args.get("convert_units"):
         convert_units = request.args.get("convert_units").title()
 
-    body = bodies.find_one({"planets._id": ObjectId(p_id)}, {
-                           "_id": 0, "planets.$": 1})
-
-    body["planets"][0]["_id"] = str(body["planets"][0]["_id"])
-
-    if convert_units:
-        body["planets"][0]["mass"] *= 5.97e24
-        body["planets"][0]["surface_temperature"] -= 273
+    planet = find_planet_view(s_id, p_id, convert_units)
 
-    return make_response(jsonify(body["planets"][0]), 200)
+    return make_response(jsonify(planet), 200)
 
 
 @planets_bp.route("/api/v1.0/bodies/<string:s_id>/planets", methods=["POST"])
@@ -91,53 +82,26 @@ def add_planet(s_id):
     if not ObjectId.is_valid(s_id):
         return make_response(jsonify({"error": "invalid star ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
+    missing = missing_fields(request.form, planet_fields)
 
-    required_fields = ["name", "radius", "mass", "density",
-                       "surface_temperature", "apoapsis", "periapsis",
-                       "eccentricity", "orbital_period", "status",
-                       "num_moons"]
+    if missing:
+        return make_response(jsonify(
+            {"error": f"missing fields: {", ".join(missing)}"}), 404)
 
-    missing_fields = [field for field in required_fields
-                      if not request.form.get(field)]
+    try:
+        planet_to_add = {"_id": ObjectId(),
+                         **build_planet(request.form, g.current_username)}
+    except ValueError as error:
+        return make_response(jsonify({"error": str(error)}), 400)
 
-    if missing_fields:
-        return make_response(jsonify(
-            {"error": f"missing fields: {", ".join(missing_fields)}"}), 404)
-
-    planet_to_add = {
-        "_id": ObjectId(),
-        "name": request.form["name"],
-        "type": "planet",
-        "radius": int(request.form["radius"]),
-        "mass": float(request.form["mass"]),
-        "density": float(request.form["density"]),
-        "surface_temperature": int(request.form["surface_temperature"]),
-        "apoapsis": int(request.form["apoapsis"]),
-        "periapsis": int(request.form["periapsis"]),
-        "eccentricity": float(request.form["eccentricity"]),
-        "orbital_period": int(request.form["orbital_period"]),
-        "status": request.form["status"],
-        "num_moons": int(request.form["num_moons"]),
-        "contributed_by": g.current_username
-    }
-
-    result = bodies.update_one({"_id": ObjectId(s_id)},
-                               {"$push": {"planets": planet_to_add}})
-    if result.modified_count == 1:
-        p_id = str(planet_to_add["_id"])
-        r_link = f"http://127.0.0.1:5000/api/v1.0/bodies/{s_id}/planets/{p_id}"
-
-        current_user = g.current_username
-        time = datetime.now().strftime("%H:%M:%S, %m/%d/%Y")
-        log = f"The user {current_user} added the planet {p_id} at {time}"
-        logs.insert_one({"user": current_user, "time": time, "action": log})
-
-        return make_response(jsonify({"url": r_link}), 201)
-    else:
-        return make_response(
-            jsonify({"error": "failed to add planet"}), 500)
+    push_planet(s_id, planet_to_add)
+
+    p_id = str(planet_to_add["_id"])
+    r_link = f"http://127.0.0.1:5000/api/v1.0/bodies/{s_id}/planets/{p_id}"
+
+    audit(g.current_username, "add_planet", p_id)
+
+    return make_response(jsonify({"url": r_link}), 201)
 
 
 @planets_bp.route("/api/v1.0/bodies/<string:s_id>/planets/<string:p_id>",
@@ -150,67 +114,27 @@ def modify_planet(s_id, p_id):
     if not ObjectId.is_valid(p_id):
         return make_response(jsonify({"error": "invalid planet ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
+    missing = missing_fields(request.form, planet_fields)
 
-    if bodies.find_one({"_id": ObjectId(s_id),
-                        "planets._id": ObjectId(p_id)}) is None:
+    if missing:
         return make_response(
-            jsonify({"error": "planet ID does not exist"}), 404)
-
-    body = bodies.find_one({"planets._id": ObjectId(p_id)}, {
-                           "_id": 0, "planets.$": 1})
-    contributor = body["planets"][0]["contributed_by"]
+            jsonify({"error": f"missing fields: {", ".join(missing)}"}),
+            404)
 
-    if not g.is_admin and contributor != g.current_username:
-        return make_response(
-            jsonify({"error": "planet must be your contribution"}), 401)
+    try:
+        modified_planet = build_planet(request.form, g.current_username)
+    except ValueError as error:
+        return make_response(jsonify({"error": str(error)}), 400)
 
-    required_fields = ["name", "radius", "mass", "density",
-                       "surface_temperature", "apoapsis", "periapsis",
-                       "eccentricity", "orbital_period", "status",
-                       "num_moons"]
+    contributor = None if g.is_admin else g.current_username
+    update_planet(s_id, p_id, modified_planet, contributor,
+                  if_match_versions())
 
-    missing_fields = [
-        field for field in required_fields if not request.form.get(field)]
+    r_link = f"http://127.0.0.1:5000/api/v1.0/bodies/{s_id}/planets/{p_id}"
 
-    if missing_fields:
-        return make_response(
-            jsonify({"error": f"missing fields: {", ".join(missing_fields)}"}),
-            404)
+    audit(g.current_username, "edit_planet", p_id)
 
-    modified_planet = {
-        "planets.$.name": request.form["name"],
-        "planets.$.type": "planet",
-        "planets.$.radius": int(request.form["radius"]),
-        "planets.$.mass": float(request.form["mass"]),
-        "planets.$.density": float(request.form["density"]),
-        "planets.$.surface_temperature":
-        int(request.form["surface_temperature"]),
-        "planets.$.apoapsis": int(request.form["apoapsis"]),
-        "planets.$.periapsis": int(request.form["periapsis"]),
-        "planets.$.eccentricity": float(request.form["eccentricity"]),
-        "planets.$.orbital_period": int(request.form["orbital_period"]),
-        "planets.$.status": request.form["status"],
-        "planets.$.num_moons": int(request.form["num_moons"]),
-        "planets.$.contributed_by": g.current_username
-    }
-
-    result = bodies.update_one({"planets._id": ObjectId(p_id)},
-                               {"$set": modified_planet})
-
-    if result.modified_count == 1:
-        r_link = f"http://127.0.0.1:5000/api/v1.0/bodies/{s_id}/planets/{p_id}"
-
-        current_user = g.current_username
-        time = datetime.now().strftime("%H:%M:%S, %m/%d/%Y")
-        log = f"The user {current_user} edited the planet {p_id} at {time}"
-        logs.insert_one({"user": current_user, "time": time, "action": log})
-
-        return make_response(jsonify({"url": r_link}), 202)
-    else:
-        return make_response(
-            jsonify({"error": "failed to modify planet"}), 500)
+    return make_response(jsonify({"url": r_link}), 202)
 
 
 @planets_bp.route("/api/v1.0/bodies/<string:s_id>/planets/<string:p_id>",
@@ -224,26 +148,9 @@ def remove_planet(s_id, p_id):
     if not ObjectId.is_valid(p_id):
         return make_response(jsonify({"error": "invalid planet ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
-
-    if bodies.find_one({"_id": ObjectId(s_id),
-                        "planets._id": ObjectId(p_id)}) is None:
-        return make_response(
-            jsonify({"error": "planet ID does not exist"}), 404)
+    pull_planet(s_id, p_id, if_match_versions())
 
-    result = bodies.update_one({"_id": ObjectId(s_id)}, {
-        "$pull": {"planets": {"_id": ObjectId(p_id)}}})
+    audit(g.current_username, "remove_planet", p_id)
 
-    if result.matched_count == 1:
-
-        current_user = g.current_username
-        time = datetime.now().strftime("%H:%M:%S, %m/%d/%Y")
-        log = f"The user {current_user} removed the planet {p_id} at {time}"
-        logs.insert_one({"user": current_user, "time": time, "action": log})
-
-        return make_response(
-            jsonify({"message": "planet deleted successfully"}), 200)
-    else:
-        return make_response(
-            jsonify({"message": "deletion attempt failed"}), 500)
+    return make_response(
+        jsonify({"message": "planet deleted successfully"}), 200)
@@ -1,18 +1,27 @@
 from flask import Blueprint, make_response, request, jsonify, g
 from bson import ObjectId
 from decorators import jwt_required, admin_required
-from datetime import datetime
-from globals import db
+from audit import audit, action_messages
+from response_cache import response_cache
+from etags import conditional_get, if_match_versions
+from feeds import sse_response
+from pagination import add_next_link, decode_cursor, keyset_filter
+from bodies_query import build_star_query, QueryError
+from bodies_repository import (find_stars, find_stars_by_ids, count_stars,
+                               find_star_view, insert_star, insert_stars,
+                               update_star, delete_star)
+from globals import max_multi_get_ids, bulk_batch_size
+from schemas import (missing_fields, star_fields, planet_fields, build_star,
+                     build_planet)
+from json import loads, JSONDecodeError
 
 stars_bp = Blueprint("stars_bp", __name__)
-bodies = db.bodies
-logs = db.logs
 
 
 @stars_bp.route("/api/v1.0/bodies", methods=["GET"])
+@response_cache.cached("star_list")
 def query_all_stars():
     page_num, page_size = 1, 10
-    order = "ascending"
     show_planets = False
     convert_units = False
 
@@ -20,59 +29,84 @@ def query_all_stars():
         page_num = int(request.args.get("pn"))
     if request.args.get("ps"):
         page_size = int(request.args.get("ps"))
-    if request.args.get("order"):
-        order = request.args.get("order")
     if request.args.get("show_planets"):
         show_planets = request.args.get("show_planets").title()
     if request.args.get("convert_units"):
         convert_units = request.args.get("convert_units").title()
 
+    if request.args.get("ids"):
+        ids = [i for i in request.args.get("ids").split(",") if i]
+        if len(ids) > max_multi_get_ids:
+            return make_response(jsonify(
+                {"error": f"at most {max_multi_get_ids} IDs per request"}),
+                400)
+        return make_response(jsonify(
+            find_stars_by_ids(ids, show_planets, convert_units)), 200)
+
     page_start = (page_size * (page_num - 1))
 
-    sort_order = 1
+    try:
+        query, sort_keys, index = build_star_query(request.args)
+    except QueryError as error:
+        return make_response(jsonify({"error": str(error)}), 400)
+
+    if request.args.get("after"):
+        after = decode_cursor(request.args.get("after"), len(sort_keys))
+        if after is None:
+            return make_response(jsonify({"error": "invalid cursor"}), 400)
+        query = {**query, **keyset_filter(sort_keys, after)}
+        page_start = 0
 
-    if order == "descending":
-        sort_order = -1
+    data_to_return = find_stars(query, sort_keys, page_start, page_size,
+                                show_planets, convert_units, index)
+    cursor_keys = [star.pop("_cursor") for star in data_to_return]
 
-    data_to_return = []
-    bodies_cursor = bodies.find().sort(
-        "distance", sort_order).skip(page_start).limit(page_size)
+    response = make_response(jsonify(data_to_return), 200)
+    response.headers["X-Query-Index"] = index
 
-    for star in bodies_cursor:
-        star["_id"] = str(star["_id"])
-        if convert_units:
-            star["distance"] *= 9.46e12
-            star["surface_temperature"] -= 273
-            star["mass"] *= 1.99e30
-        if show_planets:
-            for planet in star.get("planets", []):
-                planet["_id"] = str(planet["_id"])
-        else:
-            star.pop("planets", None)
-        data_to_return.append(star)
+    if data_to_return and len(data_to_return) == page_size:
+        add_next_link(response, cursor_keys[-1])
 
-    return make_response(jsonify(data_to_return), 200)
+    return response
 
 
 @stars_bp.route("/api/v1.0/bodies/num_of_stars", methods=["GET"])
+@response_cache.cached("star_count")
 def number_of_stars():
-    agr_pipeline = [
-        {"$match": {"type": "star"}}, {"$count": "Number of stars"}
-    ]
+    return make_response(jsonify(count_stars()), 200)
+
+
+@stars_bp.route("/api/v1.0/bodies/cache_stats", methods=["GET"])
+@jwt_required
+@admin_required
+def cache_stats():
+    return make_response(jsonify(response_cache.stats()), 200)
+
+
+@stars_bp.route("/api/v1.0/bodies/changes", methods=["GET"])
+@jwt_required
+@admin_required
+def body_changes():
+    return sse_response(request.headers.get("Last-Event-ID"),
+                        set(action_messages), change_view)
 
-    agr_return = list(bodies.aggregate(agr_pipeline))
 
-    return make_response(jsonify(agr_return), 200)
+def change_view(log):
+    change = {"action": log["action"], "user": log["user"],
+              "time": log["time"]}
+    for field in ("target_id", "target_ids"):
+        if field in log:
+            change[field] = log[field]
+    return change
 
 
 @stars_bp.route("/api/v1.0/bodies/<string:s_id>", methods=["GET"])
+@conditional_get
+@response_cache.cached("star:{s_id}")
 def query_one_star(s_id):
     if not ObjectId.is_valid(s_id):
         return make_response(jsonify({"error": "invalid star ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
-
     show_planets = False
     convert_units = False
 
@@ -81,19 +115,7 @@ def query_one_star(s_id):
     if request.args.get("convert_units"):
         convert_units = request.args.get("convert_units").title()
 
-    body = bodies.find_one({"_id": ObjectId(s_id)})
-    body["_id"] = str(body["_id"])
-
-    if convert_units:
-        body["distance"] *= 9.46e12
-        body["surface_temperature"] -= 273
-        body["mass"] *= 1.99e30
-
-    if show_planets:
-        for planet in body.get("planets", []):
-            planet["_id"] = str(planet["_id"])
-    else:
-        body.pop("planets", None)
+    body = find_star_view(s_id, show_planets, convert_units)
 
     return make_response(jsonify(body), 200)
 
@@ -102,44 +124,104 @@ def query_one_star(s_id):
 @jwt_required
 @admin_required
 def add_star():
-    required_fields = ["name", "radius", "mass", "density",
-                       "surface_temperature", "distance",
-                       "spectral_classification", "apparent_magnitude",
-                       "absolute_magnitude"]
-
-    missing_fields = [field for field in required_fields
-                      if not request.form.get(field)]
+    missing = missing_fields(request.form, star_fields)
 
-    if missing_fields:
+    if missing:
         return make_response(jsonify(
-            {"error": f"missing fields: {", ".join(missing_fields)}"}), 404)
-
-    new_star = {
-        "name": request.form["name"],
-        "type": "star",
-        "radius": int(request.form["radius"]),
-        "mass": float(request.form["mass"]),
-        "density": float(request.form["density"]),
-        "surface_temperature": int(request.form["surface_temperature"]),
-        "distance": int(request.form["distance"]),
-        "spectral_classification": request.form["spectral_classification"],
-        "apparent_magnitude": float(request.form["apparent_magnitude"]),
-        "absolute_magnitude": float(request.form["absolute_magnitude"]),
-        "planets": []
-    }
-
-    new_star_id = bodies.insert_one(new_star)
-    s_id = new_star_id.inserted_id
+            {"error": f"missing fields: {", ".join(missing)}"}), 404)
+
+    try:
+        new_star = {**build_star(request.form), "planets": []}
+    except ValueError as error:
+        return make_response(jsonify({"error": str(error)}), 400)
+
+    s_id = insert_star(new_star)
     r_link = f"http://127.0.0.1:5000/api/v1.0/bodies/{s_id}"
 
-    current_user = g.current_username
-    time = datetime.now().strftime("%H:%M:%S, %m/%d/%Y")
-    log = f"The user {current_user} created the star {s_id} at {time}"
-    logs.insert_one({"user": current_user, "time": time, "action": log})
+    audit(g.current_username, "create_star", s_id)
 
     return make_response(jsonify({"url": r_link}), 201)
 
 
+def parse_star_record(line, contributor):
+    try:
+        record = loads(line)
+    except JSONDecodeError:
+        raise ValueError("invalid JSON")
+
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+
+    missing = missing_fields(record, star_fields)
+    if missing:
+        raise ValueError(f"missing fields: {", ".join(missing)}")
+
+    planets = record.get("planets") or []
+    if not isinstance(planets, list):
+        raise ValueError("planets must be a list")
+
+    star = build_star(record)
+    star["planets"] = []
+
+    for number, planet in enumerate(planets, start=1):
+        if not isinstance(planet, dict):
+            raise ValueError(f"planet {number} must be a JSON object")
+        missing = missing_fields(planet, planet_fields)
+        if missing:
+            raise ValueError(
+                f"planet {number} missing fields: {", ".join(missing)}")
+        star["planets"].append(
+            {"_id": ObjectId(), **build_planet(planet, contributor)})
+
+    return star
+
+
+@stars_bp.route("/api/v1.0/bodies/bulk", methods=["POST"])
+@jwt_required
+@admin_required
+def bulk_add_stars():
+    batch_size = bulk_batch_size
+
+    if request.args.get("batch_size"):
+        batch_size = request.args.get("batch_size")
+        if not batch_size.isdigit() or int(batch_size) == 0:
+            return make_response(jsonify(
+                {"error": "batch_size must be a positive integer"}), 400)
+        batch_size = int(batch_size)
+
+    current_user = g.current_username
+    inserted, errors = 0, []
+    batch, batch_lines = [], []
+
+    def flush():
+        ids, failed = insert_stars(batch)
+        for index, message in failed.items():
+            errors.append({"line": batch_lines[index], "error": message})
+        if ids:
+            audit(current_user, "import_stars", f"{len(ids)} stars", ids)
+        batch.clear()
+        batch_lines.clear()
+        return len(ids)
+
+    for line_number, line in enumerate(request.stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            batch.append(parse_star_record(line, current_user))
+            batch_lines.append(line_number)
+        except ValueError as error:
+            errors.append({"line": line_number, "error": str(error)})
+        if len(batch) >= batch_size:
+            inserted += flush()
+
+    if batch:
+        inserted += flush()
+
+    return make_response(
+        jsonify({"inserted": inserted, "errors": errors}),
+        201 if inserted else 400)
+
+
 @stars_bp.route("/api/v1.0/bodies/<string:s_id>", methods=["PUT"])
 @jwt_required
 @admin_required
@@ -147,46 +229,22 @@ def modify_star(s_id):
     if not ObjectId.is_valid(s_id):
         return make_response(jsonify({"error": "invalid star ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
+    missing = missing_fields(request.form, star_fields)
 
-    required_fields = ["name", "radius", "mass", "density",
-                       "surface_temperature", "distance",
-                       "spectral_classification", "apparent_magnitude",
-                       "absolute_magnitude"]
+    if missing:
+        return make_response(jsonify(
+            {"error": f"missing fields: {", ".join(missing)}"}), 400)
 
-    missing_fields = [field for field in required_fields
-                      if not request.form.get(field)]
+    try:
+        update_star(s_id, build_star(request.form), if_match_versions())
+    except ValueError as error:
+        return make_response(jsonify({"error": str(error)}), 400)
 
-    if missing_fields:
-        return make_response(jsonify(
-            {"error": f"missing fields: {", ".join(missing_fields)}"}), 400)
-
-    result = bodies.update_one(
-        {"_id": ObjectId(s_id)}, {"$set": {
-            "name": request.form["name"],
-            "type": "star",
-            "radius": int(request.form["radius"]),
-            "mass": float(request.form["mass"]),
-            "density": float(request.form["density"]),
-            "surface_temperature": int(request.form["surface_temperature"]),
-            "distance": int(request.form["distance"]),
-            "spectral_classification": request.form["spectral_classification"],
-            "apparent_magnitude": float(request.form["apparent_magnitude"]),
-            "absolute_magnitude": float(request.form["absolute_magnitude"]),
-        }})
-
-    if result.modified_count == 1:
-        edited_star_link = f"http://127.0.0.1:5000/api/v1.0/bodies/{s_id}"
-
-        current_user = g.current_username
-        time = datetime.now().strftime("%H:%M:%S, %m/%d/%Y")
-        log = f"The user {current_user} edited the star {s_id} at {time}"
-        logs.insert_one({"user": current_user, "time": time, "action": log})
-
-        return make_response(jsonify({"url": edited_star_link}), 202)
-    else:
-        return make_response(jsonify({"error": "failed to modify star"}), 500)
+    edited_star_link = f"http://127.0.0.1:5000/api/v1.0/bodies/{s_id}"
+
+    audit(g.current_username, "edit_star", s_id)
+
+    return make_response(jsonify({"url": edited_star_link}), 202)
 
 
 @stars_bp.route("/api/v1.0/bodies/<string:s_id>", methods=["DELETE"])
@@ -196,20 +254,9 @@ def remove_star(s_id):
     if not ObjectId.is_valid(s_id):
         return make_response(jsonify({"error": "invalid star ID"}), 400)
 
-    if bodies.find_one({"_id": ObjectId(s_id)}) is None:
-        return make_response(jsonify({"error": "star ID does not exist"}), 404)
-
-    result = bodies.delete_one({"_id": ObjectId(s_id)})
-
-    if result.deleted_count == 1:
+    delete_star(s_id, if_match_versions())
 
-        current_user = g.current_username
-        time = datetime.now().strftime("%H:%M:%S, %m/%d/%Y")
-        log = f"The user {current_user} deleted the star {s_id} at {time}"
-        logs.insert_one({"user": current_user, "time": time, "action": log})
+    audit(g.current_username, "delete_star", s_id)
 
-        return make_response(
-            jsonify({"message": "star deleted successfully"}), 200)
-    else:
-        return make_response(
-            jsonify({"error": "deletion attempt failed"}), 500)
+    return make_response(
+        jsonify({"message": "star deleted successfully"}), 200)
@@ -0,0 +1,80 @@
+from indexes import index_specs, index_name, planet_status_field
+
+range_fields = ["distance", "surface_temperature", "mass"]
+equality_params = {
+    "spectral_classification": "spectral_classification",
+    "planet_status": planet_status_field
+}
+sortable_fields = ["distance", "surface_temperature", "mass"]
+
+
+class QueryError(Exception):
+    pass
+
+
+def parse_sort(args):
+    if not args.get("sort"):
+        direction = -1 if args.get("order") == "descending" else 1
+        return [("distance", direction), ("_id", direction)]
+
+    sort_keys = []
+    for part in args.get("sort").split(","):
+        field = part.lstrip("-")
+        if field not in sortable_fields:
+            raise QueryError(f"cannot sort by {field or part}")
+        if field in [key for key, _ in sort_keys]:
+            raise QueryError(f"{field} is sorted on more than once")
+        sort_keys.append((field, -1 if part.startswith("-") else 1))
+
+    if len({direction for _, direction in sort_keys}) > 1:
+        raise QueryError("mixed sort directions are not supported")
+
+    return sort_keys + [("_id", sort_keys[0][1])]
+
+
+def choose_index(equality, sort_fields, ranges):
+    for spec in index_specs["bodies"]:
+        fields = [field for field, _ in spec["keys"]]
+        prefix, rest = fields[:len(equality)], fields[len(equality):]
+        if set(prefix) != set(equality):
+            continue
+        if rest[:len(sort_fields)] != sort_fields:
+            continue
+        if not set(ranges) <= set(fields):
+            continue
+        return index_name(spec["keys"])
+    return None
+
+
+def build_star_query(args):
+    query = {}
+    equality = []
+    ranges = []
+
+    for param, field in equality_params.items():
+        if not args.get(param):
+            continue
+        values = args.get(param).split(",")
+        query[field] = values[0] if len(values) == 1 else {"$in": values}
+        equality.append(field)
+
+    for field in range_fields:
+        bounds = {}
+        for prefix, operator in (("min_", "$gte"), ("max_", "$lte")):
+            if args.get(prefix + field):
+                try:
+                    bounds[operator] = float(args.get(prefix + field))
+                except ValueError:
+                    raise QueryError(f"invalid {prefix}{field}")
+        if bounds:
+            query[field] = bounds
+            ranges.append(field)
+
+    sort_keys = parse_sort(args)
+    index = choose_index(equality, [field for field, _ in sort_keys], ranges)
+
+    if index is None:
+        raise QueryError("no index supports this combination of filters "
+                         "and sort order")
+
+    return query, sort_keys, index
@@ -0,0 +1,462 @@
+from flask import make_response, jsonify
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from globals import db, planet_storage
+from response_cache import response_cache
+from stats import increment, planet_changes, read_count
+
+bodies = db.bodies
+planets = db.planets
+
+reads_planet_collection = planet_storage in ("dual", "collection")
+writes_embedded_planets = planet_storage in ("embedded", "dual")
+writes_planet_collection = planet_storage in ("dual", "collection")
+
+
+class BodyError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def body_error_response(error):
+    return make_response(jsonify({"error": error.message}), error.status)
+
+
+def star_not_found():
+    return BodyError("star ID does not exist", 404)
+
+
+def planet_not_found():
+    return BodyError("planet ID does not exist", 404)
+
+
+def version_conflict():
+    return BodyError("star has changed, fetch it again", 412)
+
+
+def version_filter(versions):
+    if versions is None:
+        return {}
+    if 0 in versions:
+        versions = [*versions, None]
+    return {"version": {"$in": list(versions)}}
+
+
+def write_failed(s_id, versions):
+    find_star(s_id, {"_id": 1})
+    if versions is not None:
+        raise version_conflict()
+
+
+def star_conversions():
+    return {
+        "distance": {"$multiply": ["$distance", 9.46e12]},
+        "surface_temperature": {"$subtract": ["$surface_temperature", 273]},
+        "mass": {"$multiply": ["$mass", 1.99e30]}
+    }
+
+
+def planet_view(variable, convert_units):
+    if not convert_units:
+        return variable
+    return {"$mergeObjects": [variable, {
+        "mass": {"$multiply": [f"{variable}.mass", 5.97e24]},
+        "surface_temperature": {
+            "$subtract": [f"{variable}.surface_temperature", 273]}}]}
+
+
+def planets_view(planets_expression, convert_units):
+    if not convert_units:
+        return {"$ifNull": [planets_expression, []]}
+    return {"$map": {"input": {"$ifNull": [planets_expression, []]},
+                     "as": "planet",
+                     "in": planet_view("$$planet", convert_units)}}
+
+
+def embedded_planets(p_id=None):
+    if p_id is None:
+        return {"$ifNull": ["$planets", []]}
+    return {"$filter": {"input": {"$ifNull": ["$planets", []]},
+                        "cond": {"$eq": ["$$this._id", ObjectId(p_id)]}}}
+
+
+def planet_source_stages(p_id=None):
+    if not reads_planet_collection:
+        return [{"$set": {"planets": embedded_planets(p_id)}}]
+
+    planet_match = {} if p_id is None else {"_id": ObjectId(p_id)}
+    stages = [{"$lookup": {
+        "from": "planets", "localField": "_id", "foreignField": "star_id",
+        "pipeline": [{"$match": planet_match}, {"$sort": {"_id": 1}},
+                     {"$project": {"star_id": 0}}],
+        "as": "stored_planets"}}]
+
+    if planet_storage == "dual":
+        stages.append({"$set": {"planets": {"$cond": [
+            {"$eq": ["$planets_migrated", True]},
+            "$stored_planets", embedded_planets(p_id)]}}})
+    else:
+        stages.append({"$set": {"planets": "$stored_planets"}})
+
+    stages.append({"$unset": "stored_planets"})
+    return stages
+
+
+def star_view_stages(show_planets, convert_units):
+    if show_planets:
+        stages = [*planet_source_stages(),
+                  {"$project": {"planets_migrated": 0, "planet_statuses": 0,
+                                "version": 0}}]
+    else:
+        stages = [{"$project": {"planets": 0, "planets_migrated": 0,
+                                "planet_statuses": 0, "version": 0}}]
+    if convert_units:
+        stages.append({"$set": star_conversions()})
+    return stages
+
+
+def find_stars(query, sort_keys, skip, limit, show_planets, convert_units,
+               index=None):
+    pipeline = [{"$match": query}, {"$sort": dict(sort_keys)}]
+    if skip:
+        pipeline.append({"$skip": skip})
+    pipeline.append({"$limit": limit})
+    pipeline.append({"$set": {
+        "_cursor": [f"${field}" for field, _ in sort_keys]}})
+    pipeline.extend(star_view_stages(show_planets, convert_units))
+    if index is not None:
+        return list(bodies.aggregate(pipeline, hint=index))
+    return list(bodies.aggregate(pipeline))
+
+
+def in_request_order(ids, documents):
+    found = {document["_id"]: document for document in documents}
+    ordered = []
+    for requested_id in ids:
+        if not ObjectId.is_valid(requested_id):
+            ordered.append({"_id": requested_id, "error": "invalid"})
+        elif ObjectId(requested_id) in found:
+            ordered.append(found[ObjectId(requested_id)])
+        else:
+            ordered.append({"_id": requested_id, "error": "not_found"})
+    return ordered
+
+
+def valid_object_ids(ids):
+    return list({ObjectId(i) for i in ids if ObjectId.is_valid(i)})
+
+
+def find_stars_by_ids(ids, show_planets, convert_units):
+    documents = bodies.aggregate([
+        {"$match": {"_id": {"$in": valid_object_ids(ids)}}},
+        *star_view_stages(show_planets, convert_units)
+    ])
+    return in_request_order(ids, documents)
+
+
+def find_planets_by_ids(ids, convert_units):
+    object_ids = valid_object_ids(ids)
+    if planet_storage == "collection":
+        documents = planets.aggregate([
+            {"$match": {"_id": {"$in": object_ids}}},
+            {"$replaceRoot": {
+                "newRoot": planet_view("$$ROOT", convert_units)}}
+        ])
+    else:
+        documents = bodies.aggregate([
+            {"$match": {"planets._id": {"$in": object_ids}}},
+            {"$project": {"planets": {"$filter": {
+                "input": "$planets",
+                "cond": {"$in": ["$$this._id", object_ids]}}}}},
+            {"$unwind": "$planets"},
+            {"$set": {"planets.star_id": "$_id"}},
+            {"$replaceRoot": {
+                "newRoot": planet_view("$planets", convert_units)}}
+        ])
+    return in_request_order(ids, documents)
+
+
+def count_stars():
+    count = read_count("stars")
+    return [{"Number of stars": count}] if count else []
+
+
+def count_planets():
+    count = read_count("planets")
+    return [{"Number of planets": count}] if count else []
+
+
+def find_star(s_id, projection=None):
+    star = bodies.find_one({"_id": ObjectId(s_id)}, projection)
+    if star is None:
+        raise star_not_found()
+    return star
+
+
+def star_version(s_id):
+    star = bodies.find_one({"_id": ObjectId(s_id)}, {"_id": 1, "version": 1})
+    if star is None:
+        return None
+    return star.get("version", 0)
+
+
+def find_star_view(s_id, show_planets, convert_units):
+    stars = list(bodies.aggregate([
+        {"$match": {"_id": ObjectId(s_id)}},
+        *star_view_stages(show_planets, convert_units)
+    ]))
+    if not stars:
+        raise star_not_found()
+    return stars[0]
+
+
+def find_planets(s_id, convert_units, p_id=None):
+    stars = list(bodies.aggregate([
+        {"$match": {"_id": ObjectId(s_id)}},
+        *planet_source_stages(p_id),
+        {"$project": {"_id": 0,
+                      "planets": planets_view("$planets", convert_units)}}
+    ]))
+    if not stars:
+        raise star_not_found()
+    return stars[0]["planets"]
+
+
+def find_planet_view(s_id, p_id, convert_units):
+    found = find_planets(s_id, convert_units, p_id)
+    if not found:
+        raise planet_not_found()
+    return found[0]
+
+
+def find_planet(s_id, p_id):
+    if not writes_embedded_planets:
+        find_star(s_id, {"_id": 1})
+        planet = planets.find_one({"_id": ObjectId(p_id),
+                                   "star_id": ObjectId(s_id)})
+        if planet is None:
+            raise planet_not_found()
+        return planet
+
+    star = find_star(s_id, {"_id": 0, "planets": {
+        "$elemMatch": {"_id": ObjectId(p_id)}}})
+    if not star.get("planets"):
+        raise planet_not_found()
+    return star["planets"][0]
+
+
+def planet_statuses(star_planets):
+    return sorted({planet["status"] for planet in star_planets
+                   if planet.get("status") is not None})
+
+
+def refresh_planet_statuses(s_id):
+    statuses = planets.distinct("status", {"star_id": ObjectId(s_id)})
+    bodies.update_one({"_id": ObjectId(s_id)}, {"$set": {
+        "planet_statuses": planet_statuses(
+            [{"status": status} for status in statuses])}})
+
+
+def insert_star(star):
+    star = dict(star)
+    star_planets = star.pop("planets", [])
+    if writes_embedded_planets:
+        star["planets"] = star_planets
+    if writes_planet_collection:
+        star["planet_statuses"] = planet_statuses(star_planets)
+    if planet_storage == "dual":
+        star["planets_migrated"] = True
+
+    s_id = bodies.insert_one(star).inserted_id
+
+    if writes_planet_collection and star_planets:
+        planets.insert_many([{**planet, "star_id": s_id}
+                             for planet in star_planets])
+
+    increment({"stars": 1, **planet_changes(star_planets, 1)})
+    response_cache.invalidate("star_list", "star_count")
+    return s_id
+
+
+def insert_stars(stars):
+    documents = []
+    star_planets = []
+    for star in stars:
+        star = {"_id": ObjectId(), **star}
+        star_planets.append(star.pop("planets", []))
+        if writes_embedded_planets:
+            star["planets"] = star_planets[-1]
+        if writes_planet_collection:
+            star["planet_statuses"] = planet_statuses(star_planets[-1])
+        if planet_storage == "dual":
+            star["planets_migrated"] = True
+        documents.append(star)
+
+    failed = {}
+    try:
+        bodies.insert_many(documents, ordered=False)
+    except BulkWriteError as error:
+        failed = {write_error["index"]: write_error["errmsg"]
+                  for write_error in error.details["writeErrors"]}
+
+    inserted = [i for i in range(len(documents)) if i not in failed]
+
+    owners = [i for i in inserted for _ in star_planets[i]]
+    if writes_planet_collection and owners:
+        try:
+            planets.insert_many([{**planet, "star_id": documents[i]["_id"]}
+                                 for i in inserted
+                                 for planet in star_planets[i]],
+                                ordered=False)
+        except BulkWriteError as error:
+            for write_error in error.details["writeErrors"]:
+                failed.setdefault(owners[write_error["index"]],
+                                  write_error["errmsg"])
+            removed = [documents[i]["_id"] for i in inserted if i in failed]
+            bodies.delete_many({"_id": {"$in": removed}})
+            planets.delete_many({"star_id": {"$in": removed}})
+            inserted = [i for i in inserted if i not in failed]
+
+    inserted_planets = [planet for i in inserted for planet in star_planets[i]]
+
+    if inserted:
+        increment({"stars": len(inserted),
+                   **planet_changes(inserted_planets, 1)})
+        response_cache.invalidate("star_list", "star_count", "planet_count")
+
+    return [documents[i]["_id"] for i in inserted], failed
+
+
+def bump_version(s_id, versions=None, update=None):
+    result = bodies.update_one(
+        {"_id": ObjectId(s_id), **version_filter(versions)},
+        {"$inc": {"version": 1}, **(update or {})})
+    if result.matched_count == 0:
+        write_failed(s_id, versions)
+
+
+def update_star(s_id, fields, versions=None):
+    result = bodies.update_one(
+        {"_id": ObjectId(s_id), **version_filter(versions)},
+        {"$set": fields, "$inc": {"version": 1}})
+    if result.matched_count == 0:
+        write_failed(s_id, versions)
+    response_cache.invalidate("star_list", f"star:{s_id}")
+
+
+def delete_star(s_id, versions=None):
+    star = bodies.find_one_and_delete(
+        {"_id": ObjectId(s_id), **version_filter(versions)},
+        {"planets.status": 1, "planets.contributed_by": 1})
+    if star is None:
+        write_failed(s_id, versions)
+
+    removed_planets = star.get("planets", [])
+    if writes_planet_collection:
+        if not writes_embedded_planets:
+            removed_planets = list(planets.find(
+                {"star_id": ObjectId(s_id)},
+                {"status": 1, "contributed_by": 1}))
+        planets.delete_many({"star_id": ObjectId(s_id)})
+
+    increment({"stars": -1, **planet_changes(removed_planets, -1)})
+    response_cache.invalidate("star_list", "star_count", "planet_count",
+                              f"star:{s_id}")
+
+
+def push_planet(s_id, planet):
+    update = {}
+    if writes_planet_collection and planet.get("status") is not None:
+        update["$addToSet"] = {"planet_statuses": planet["status"]}
+
+    if writes_embedded_planets:
+        result = bodies.update_one({"_id": ObjectId(s_id)},
+                                   {"$push": {"planets": planet},
+                                    "$inc": {"version": 1}, **update})
+        if result.matched_count == 0:
+            raise star_not_found()
+    else:
+        bump_version(s_id, update=update)
+
+    if writes_planet_collection:
+        planets.insert_one({**planet, "star_id": ObjectId(s_id)})
+
+    increment(planet_changes([planet], 1))
+    response_cache.invalidate("star_list", "planet_count", f"star:{s_id}")
+
+
+def update_planet(s_id, p_id, fields, contributor=None, versions=None):
+    planet_filter = {"_id": ObjectId(p_id)}
+    if contributor is not None:
+        planet_filter["contributed_by"] = contributor
+
+    if writes_embedded_planets:
+        star = bodies.find_one_and_update(
+            {"_id": ObjectId(s_id), "planets": {"$elemMatch": planet_filter},
+             **version_filter(versions)},
+            {"$set": {f"planets.$.{field}": value
+                      for field, value in fields.items()},
+             "$inc": {"version": 1}},
+            {"_id": 0, "planets": {"$elemMatch": {"_id": ObjectId(p_id)}}})
+        previous = star["planets"][0] if star is not None else None
+        if previous is not None and writes_planet_collection:
+            planets.update_one({"_id": ObjectId(p_id)}, {"$set": fields})
+            if "status" in fields:
+                refresh_planet_statuses(s_id)
+    else:
+        planet_filter["star_id"] = ObjectId(s_id)
+        previous = None
+        if planets.find_one(planet_filter, {"_id": 1}) is not None:
+            bump_version(s_id, versions)
+            previous = planets.find_one_and_update(
+                planet_filter, {"$set": fields},
+                {"status": 1, "contributed_by": 1})
+        if previous is not None and "status" in fields:
+            refresh_planet_statuses(s_id)
+
+    if previous is None:
+        planet = find_planet(s_id, p_id)
+        if contributor is not None and \
+                planet.get("contributed_by") != contributor:
+            raise BodyError("planet must be your contribution", 401)
+        if versions is not None and writes_embedded_planets:
+            raise version_conflict()
+        raise planet_not_found()
+
+    changes = planet_changes([previous], -1)
+    changes.update(planet_changes([{**previous, **fields}], 1))
+    increment(changes)
+    response_cache.invalidate("star_list", f"star:{s_id}")
+
+
+def pull_planet(s_id, p_id, versions=None):
+    if writes_embedded_planets:
+        star = bodies.find_one_and_update(
+            {"_id": ObjectId(s_id), "planets._id": ObjectId(p_id),
+             **version_filter(versions)},
+            {"$pull": {"planets": {"_id": ObjectId(p_id)}},
+             "$inc": {"version": 1}},
+            {"_id": 0, "planets": {"$elemMatch": {"_id": ObjectId(p_id)}}})
+        removed = star["planets"][0] if star is not None else None
+        if removed is not None and writes_planet_collection:
+            planets.delete_one({"_id": ObjectId(p_id)})
+            refresh_planet_statuses(s_id)
+    else:
+        planet_filter = {"_id": ObjectId(p_id), "star_id": ObjectId(s_id)}
+        removed = None
+        if planets.find_one(planet_filter, {"_id": 1}) is not None:
+            bump_version(s_id, versions)
+            removed = planets.find_one_and_delete(
+                planet_filter, {"status": 1, "contributed_by": 1})
+        if removed is not None:
+            refresh_planet_statuses(s_id)
+
+    if removed is None:
+        find_planet(s_id, p_id)
+        if versions is not None and writes_embedded_planets:
+            raise version_conflict()
+        raise planet_not_found()
+    increment(planet_changes([removed], -1))
+    response_cache.invalidate("star_list", "planet_count", f"star:{s_id}")
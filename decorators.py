@@ -1,9 +1,19 @@
 from flask import request, make_response, jsonify, g
 from functools import wraps
+from time import perf_counter
 from jwt import decode
-from globals import secret_key, db
+from globals import secret_key
+from revocation import revocations
+from token_cache import claims_cache
+from metrics import add_timing
 
-blacklist = db.blacklist
+
+def verify_token(token):
+    data = claims_cache.get(token)
+    if data is None:
+        data = decode(token, secret_key, algorithms="HS256")
+        claims_cache.put(token, data)
+    return data
 
 
 def jwt_required(func):
@@ -15,16 +25,21 @@ def jwt_required(func):
         if not token:
             return make_response(jsonify(
                 {"message": "Token is missing, you may need to login"}), 401)
-        bl_token = blacklist.find_one({"token": token})
-        if bl_token is not None:
-            return make_response(jsonify(
-                {"message": "Token has expired, refresh session"}), 401)
+        started = perf_counter()
         try:
-            data = decode(token, secret_key, algorithms="HS256")
-            g.current_username = data.get("user")
-            g.is_admin = data.get("is_admin")
+            data = verify_token(token)
         except:
-            make_response(jsonify({"message": "Token is invalid"}), 401)
+            return make_response(jsonify({"message": "Token is invalid"}), 401)
+        if "jti" not in data:
+            return make_response(jsonify({"message": "Token is invalid"}), 401)
+        revoked = revocations.is_revoked(data["jti"])
+        add_timing("auth", perf_counter() - started)
+        if revoked:
+            return make_response(jsonify(
+                {"message": "Token has expired, refresh session"}), 401)
+        g.token_claims = data
+        g.current_username = data.get("user")
+        g.is_admin = data.get("is_admin")
         return func(*args, **kwargs)
     return jwt_required_wrapper
 
@@ -32,9 +47,7 @@ def jwt_required(func):
 def admin_required(func):
     @wraps(func)
     def admin_required_wrapper(*args, **kwargs):
-        token = request.headers["x-access-token"]
-        data = decode(token, secret_key, algorithms="HS256")
-        if data["is_admin"]:
+        if g.token_claims.get("is_admin"):
             return func(*args, **kwargs)
         else:
             return make_response(jsonify(
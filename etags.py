@@ -0,0 +1,50 @@
+from functools import wraps
+from hashlib import sha256
+from bson import ObjectId
+from flask import Response, g, make_response, request
+from bodies_repository import star_version, version_conflict
+from response_cache import request_key
+
+
+def make_etag(version):
+    digest = sha256(request_key().encode("utf-8")).hexdigest()[:16]
+    return f"{version}-{digest}"
+
+
+def if_match_versions():
+    if not request.if_match or request.if_match.star_tag:
+        return None
+
+    versions = set()
+    for etag in request.if_match.as_set():
+        version = etag.split("-", 1)[0]
+        if version.isdigit():
+            versions.add(int(version))
+    if not versions:
+        raise version_conflict()
+    return versions
+
+
+def conditional_get(func):
+    @wraps(func)
+    def conditional_wrapper(*args, **kwargs):
+        s_id = kwargs["s_id"]
+        if not ObjectId.is_valid(s_id):
+            return func(*args, **kwargs)
+
+        version = star_version(s_id)
+        if version is None:
+            return func(*args, **kwargs)
+
+        etag = make_etag(version)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        g.star_version = version
+        response = make_response(func(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+    return conditional_wrapper
@@ -0,0 +1,180 @@
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from queue import Queue, Empty, Full
+from threading import Lock, Thread, current_thread
+from time import sleep
+from bson import ObjectId
+from flask import Response, current_app, stream_with_context
+from pymongo.errors import PyMongoError
+from globals import (db, feed_poll_seconds, feed_overlap_seconds,
+                     feed_keepalive_seconds, feed_queue_size,
+                     feed_catchup_limit)
+
+logs = db.logs
+
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue = Queue(maxsize=queue_size)
+        self.lagging = False
+
+
+class LogFeed:
+    def __init__(self, collection, poll_seconds, overlap_seconds,
+                 queue_size):
+        self.collection = collection
+        self.poll_seconds = poll_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.thread = None
+        self.last_id = None
+        self.lock = Lock()
+
+    def subscribe(self):
+        subscriber = Subscriber(self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def active(self):
+        with self.lock:
+            if self.subscribers:
+                return True
+            self.thread = None
+            return False
+
+    def publish(self, document):
+        self.last_id = document["_id"]
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(document)
+            except Full:
+                subscriber.lagging = True
+
+    def replica_set(self):
+        try:
+            hello = self.collection.database.client.admin.command("hello")
+        except PyMongoError:
+            return False
+        return "setName" in hello
+
+    def run(self):
+        self.last_id = ObjectId.from_datetime(datetime.now(UTC))
+        try:
+            if self.replica_set():
+                try:
+                    self.watch()
+                    return
+                except PyMongoError:
+                    pass
+            self.poll(self.last_id)
+        finally:
+            with self.lock:
+                if self.thread is current_thread():
+                    self.thread = None
+                    for subscriber in self.subscribers:
+                        subscriber.lagging = True
+
+    def watch(self):
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        with self.collection.watch(pipeline, max_await_time_ms=1000) \
+                as stream:
+            while self.active():
+                change = stream.try_next()
+                if change is not None:
+                    self.publish(change["fullDocument"])
+
+    def poll(self, resume_after):
+        watermark = resume_after.generation_time
+        seen = set()
+        recent = deque()
+
+        while self.active():
+            try:
+                documents = self.collection.find({"_id": {
+                    "$gte": ObjectId.from_datetime(watermark - self.overlap)
+                }}).sort("_id", 1)
+                for document in documents:
+                    if document["_id"] in seen or \
+                            document["_id"] <= resume_after:
+                        continue
+                    seen.add(document["_id"])
+                    recent.append(document["_id"])
+                    watermark = max(watermark,
+                                    document["_id"].generation_time)
+                    self.publish(document)
+            except PyMongoError:
+                pass
+
+            cutoff = watermark - self.overlap
+            while recent and recent[0].generation_time < cutoff:
+                seen.discard(recent.popleft())
+            sleep(self.poll_seconds)
+
+
+log_feed = LogFeed(logs, feed_poll_seconds, feed_overlap_seconds,
+                   feed_queue_size)
+
+
+def catch_up(last_event_id, actions):
+    if not last_event_id or not ObjectId.is_valid(last_event_id):
+        return []
+    query = {"_id": {"$gt": ObjectId(last_event_id)}}
+    if actions is not None:
+        query["action"] = {"$in": list(actions)}
+    return list(logs.find(query).sort("_id", 1).limit(feed_catchup_limit))
+
+
+def sse_event(document, view):
+    data = current_app.json.dumps(view(document))
+    return f"id: {document["_id"]}\nevent: {document.get("action")}\n" \
+           f"data: {data}\n\n"
+
+
+def sse_response(last_event_id, actions=None, view=None):
+    view = view or (lambda document: document)
+
+    def generate():
+        subscriber = log_feed.subscribe()
+        try:
+            yield f"retry: {feed_keepalive_seconds * 1000}\n\n"
+
+            missed = catch_up(last_event_id, actions)
+            sent = set()
+            for document in missed:
+                sent.add(document["_id"])
+                yield sse_event(document, view)
+            if len(missed) == feed_catchup_limit:
+                return
+
+            while not subscriber.lagging:
+                try:
+                    document = subscriber.queue.get(
+                        timeout=feed_keepalive_seconds)
+                except Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if document["_id"] in sent:
+                    continue
+                if actions is not None and document.get("action") \
+                        not in actions:
+                    continue
+                yield sse_event(document, view)
+        finally:
+            log_feed.unsubscribe(subscriber)
+
+    response = Response(stream_with_context(generate()),
+                        mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -1,5 +1,58 @@
+from os import environ
 from pymongo import MongoClient
+from metrics import command_metrics
 
-client = MongoClient("mongodb://127.0.0.1/27017")
-db = client.EDB_DB
+mongo_uri = environ.get("MONGO_URI", "mongodb://127.0.0.1/27017")
+db_name = environ.get("MONGO_DB", "EDB_DB")
+
+client = MongoClient(mongo_uri, event_listeners=[command_metrics])
+db = client[db_name]
 secret_key = "thewitchofcolchis"
+
+revocation_refresh_seconds = 2
+revocation_max_entries = 100000
+claims_cache_max_entries = 10000
+
+bcrypt_rounds = 12
+hashing_workers = 2
+hashing_queue_size = 32
+hashing_timeout_seconds = 10
+
+audit_batch_size = 500
+audit_flush_seconds = 1
+audit_queue_size = 10000
+audit_put_timeout_seconds = 0.5
+audit_synchronous = False
+
+stream_batch_size = 1000
+
+response_cache_backend = "memory"
+response_cache_ttl_seconds = 60
+response_cache_max_bytes = 64 * 1024 * 1024
+
+planet_storage = "embedded"
+
+max_multi_get_ids = 200
+
+bulk_batch_size = 1000
+
+server_timing_header = False
+mongo_reply_bytes = False
+
+profile_rate_limit = 10
+profile_rate_window_seconds = 60
+profile_top_functions = 25
+profile_max_explains = 10
+
+feed_poll_seconds = 1
+feed_overlap_seconds = 5
+feed_keepalive_seconds = 15
+feed_queue_size = 1000
+feed_catchup_limit = 1000
+
+log_retention_days = 90
+log_archive_dir = "log_archive"
+retention_batch_size = 5000
+
+activity_windows = {"hour": 1, "day": 24, "week": 24 * 7}
+activity_bucket_ttl_seconds = 8 * 24 * 60 * 60
@@ -0,0 +1,77 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from multiprocessing import get_context
+from threading import BoundedSemaphore, Lock
+from bcrypt import checkpw, gensalt, hashpw
+from globals import (bcrypt_rounds, hashing_workers, hashing_queue_size,
+                     hashing_timeout_seconds)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def hash_in_worker(password, rounds):
+    return hashpw(password, gensalt(rounds))
+
+
+def check_in_worker(password, hashed):
+    return checkpw(password, hashed)
+
+
+def hash_cost(hashed):
+    try:
+        return int(hashed.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class HashingService:
+    def __init__(self, rounds, workers, queue_size, timeout_seconds):
+        self.rounds = rounds
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+        self.slots = BoundedSemaphore(workers + queue_size)
+        self.executor = None
+        self.lock = Lock()
+
+    def pool(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_context("forkserver"))
+            return self.executor
+
+    def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.pool().submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout_seconds)
+        except FutureTimeoutError:
+            raise HashingBusy()
+
+    def hash_password(self, password):
+        return self.run(hash_in_worker, password, self.rounds)
+
+    def check_password(self, password, hashed):
+        return self.run(check_in_worker, password, hashed)
+
+    def needs_rehash(self, hashed):
+        return hash_cost(hashed) != self.rounds
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+
+hashing_service = HashingService(bcrypt_rounds, hashing_workers,
+                                 hashing_queue_size, hashing_timeout_seconds)
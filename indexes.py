@@ -0,0 +1,86 @@
+from pymongo import ASCENDING
+from globals import db, planet_storage, activity_bucket_ttl_seconds
+
+if planet_storage == "collection":
+    planet_status_field = "planet_statuses"
+else:
+    planet_status_field = "planets.status"
+
+index_specs = {
+    "users": [
+        {"keys": [("username", ASCENDING)], "unique": True},
+        {"keys": [("email", ASCENDING)], "unique": True}
+    ],
+    "blacklist": [
+        {"keys": [("jti", ASCENDING)], "unique": True, "sparse": True},
+        {"keys": [("exp", ASCENDING)], "expireAfterSeconds": 0}
+    ],
+    "logs": [
+        {"keys": [("user", ASCENDING), ("time", ASCENDING),
+                  ("_id", ASCENDING)]},
+        {"keys": [("action", ASCENDING), ("time", ASCENDING),
+                  ("_id", ASCENDING)]},
+        {"keys": [("time", ASCENDING), ("_id", ASCENDING)]}
+    ],
+    "log_rollups": [
+        {"keys": [("user", ASCENDING), ("day", ASCENDING)]},
+        {"keys": [("action", ASCENDING), ("day", ASCENDING)]},
+        {"keys": [("day", ASCENDING)]},
+        {"keys": [("part", ASCENDING)]}
+    ],
+    "activity_buckets": [
+        {"keys": [("hour", ASCENDING)],
+         "expireAfterSeconds": activity_bucket_ttl_seconds}
+    ],
+    "bodies": [
+        {"keys": [("planets._id", ASCENDING)]},
+        {"keys": [("_id", ASCENDING), ("version", ASCENDING)]},
+        {"keys": [("distance", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("surface_temperature", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("mass", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("distance", ASCENDING), ("mass", ASCENDING),
+                  ("_id", ASCENDING)]},
+        {"keys": [("spectral_classification", ASCENDING),
+                  ("distance", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("spectral_classification", ASCENDING),
+                  ("surface_temperature", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("spectral_classification", ASCENDING),
+                  ("mass", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [(planet_status_field, ASCENDING), ("distance", ASCENDING),
+                  ("_id", ASCENDING)]},
+        {"keys": [("spectral_classification", ASCENDING),
+                  (planet_status_field, ASCENDING), ("distance", ASCENDING),
+                  ("_id", ASCENDING)]}
+    ],
+    "planets": [
+        {"keys": [("star_id", ASCENDING), ("_id", ASCENDING)]},
+        {"keys": [("status", ASCENDING), ("star_id", ASCENDING)]}
+    ],
+    "response_cache": [
+        {"keys": [("tags", ASCENDING)]},
+        {"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0}
+    ]
+}
+
+
+def index_name(keys):
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def ensure_indexes(database=db, collections=None):
+    created = []
+    for collection_name, specs in index_specs.items():
+        if collections is not None and collection_name not in collections:
+            continue
+        collection = database[collection_name]
+        for spec in specs:
+            options = {key: value for key, value in spec.items()
+                       if key != "keys"}
+            created.append((collection_name,
+                            collection.create_index(spec["keys"], **options)))
+    return created
+
+
+if __name__ == "__main__":
+    for collection_name, created_name in ensure_indexes():
+        print(f"{collection_name}: {created_name}")
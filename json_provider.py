@@ -0,0 +1,42 @@
+from base64 import b64encode
+from time import perf_counter
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+from orjson import dumps, loads, OPT_NAIVE_UTC, OPT_NON_STR_KEYS
+from metrics import add_timing
+
+options = OPT_NAIVE_UTC | OPT_NON_STR_KEYS
+
+
+def default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return b64encode(value).decode("ascii")
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON "
+                    "serializable")
+
+
+def encode(obj):
+    started = perf_counter()
+    try:
+        return dumps(obj, default=default, option=options)
+    finally:
+        add_timing("serialize", perf_counter() - started)
+
+
+class FastJSONProvider(JSONProvider):
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return encode(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(encode(obj) + b"\n",
+                                        mimetype=self.mimetype)
@@ -0,0 +1,197 @@
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from bson import encode
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+latency_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+command_count_buckets = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(sample(f"{name}_bucket",
+                                {**labels, "le": str(bound)}, cumulative))
+        lines.append(sample(f"{name}_bucket", {**labels, "le": "+Inf"},
+                            self.count))
+        lines.append(sample(f"{name}_sum", labels, self.sum))
+        lines.append(sample(f"{name}_count", labels, self.count))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.lock = Lock()
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def render(self, help_texts, gauges=()):
+        output = []
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        written = set()
+        for (name, labels), histogram in histograms:
+            if name not in written:
+                output.extend(header(name, "histogram", help_texts))
+                written.add(name)
+            output.extend(histogram.lines(name, dict(labels)))
+        for (name, labels), value in counters:
+            if name not in written:
+                output.extend(header(name, "counter", help_texts))
+                written.add(name)
+            output.append(sample(name, dict(labels), value))
+        for name, kind, value in gauges:
+            if value is None:
+                continue
+            output.extend(header(name, kind, help_texts))
+            output.append(sample(name, {}, value))
+        return "\n".join(output) + "\n"
+
+
+def header(name, kind, help_texts):
+    return [f"# HELP {name} {help_texts.get(name, name)}",
+            f"# TYPE {name} {kind}"]
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def sample(name, labels, value):
+    if labels:
+        label_text = ",".join(f'{key}="{escape(label)}"'
+                              for key, label in labels.items())
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+
+def add_timing(kind, seconds):
+    if has_request_context() and "timings" in g:
+        g.timings[kind] += seconds
+
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self.reply_bytes = False
+
+    def started(self, event):
+        if has_request_context() and g.get("captured_commands") is not None:
+            g.captured_commands.append((event.database_name,
+                                        event.command_name,
+                                        dict(event.command)))
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1000000
+        reply_bytes = len(encode(event.reply)) if self.reply_bytes else 0
+        registry.observe("edb_mongo_command_duration_seconds",
+                         {"command": event.command_name}, seconds,
+                         latency_buckets)
+        if self.reply_bytes:
+            registry.increment("edb_mongo_reply_bytes_total",
+                               {"command": event.command_name}, reply_bytes)
+        if has_request_context() and "timings" in g:
+            g.timings["db"] += seconds
+            g.db_commands += 1
+            g.db_bytes += reply_bytes
+
+    def failed(self, event):
+        registry.increment("edb_mongo_command_failures_total",
+                           {"command": event.command_name})
+        if has_request_context() and "timings" in g:
+            g.timings["db"] += event.duration_micros / 1000000
+            g.db_commands += 1
+
+
+help_texts = {
+    "edb_http_request_duration_seconds":
+        "Handler latency by route, method and status",
+    "edb_request_mongo_commands": "Mongo commands issued per request",
+    "edb_request_mongo_reply_bytes_total":
+        "Bytes returned by Mongo to requests by route",
+    "edb_mongo_command_duration_seconds": "Mongo command latency",
+    "edb_mongo_reply_bytes_total": "Bytes returned by Mongo by command",
+    "edb_mongo_command_failures_total": "Failed Mongo commands",
+    "edb_claims_cache_hits_total": "Token claims cache hits",
+    "edb_claims_cache_misses_total": "Token claims cache misses",
+    "edb_claims_cache_entries": "Token claims cache entries",
+    "edb_response_cache_hits_total": "Response cache hits",
+    "edb_response_cache_misses_total": "Response cache misses",
+    "edb_response_cache_entries": "Response cache entries",
+    "edb_response_cache_bytes": "Response cache size in bytes",
+    "edb_response_cache_evictions_total": "Response cache evictions"
+}
+
+registry = Registry()
+command_metrics = CommandMetrics()
+
+
+def start_request():
+    g.request_started = perf_counter()
+    g.timings = {"db": 0.0, "auth": 0.0, "serialize": 0.0}
+    g.db_commands = 0
+    g.db_bytes = 0
+
+
+def finish_request(response, server_timing):
+    if "request_started" not in g:
+        return response
+
+    elapsed = perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    labels = {"route": route, "method": request.method}
+
+    registry.observe("edb_http_request_duration_seconds",
+                     {**labels, "status": str(response.status_code)},
+                     elapsed, latency_buckets)
+    registry.observe("edb_request_mongo_commands", labels, g.db_commands,
+                     command_count_buckets)
+    if command_metrics.reply_bytes:
+        registry.increment("edb_request_mongo_reply_bytes_total", labels,
+                           g.db_bytes)
+
+    if server_timing:
+        response.headers["Server-Timing"] = ", ".join(
+            [f"{kind};dur={seconds * 1000:.2f}"
+             for kind, seconds in g.timings.items()] +
+            [f"total;dur={elapsed * 1000:.2f}"])
+    return response
+
+
+def init_metrics(app, server_timing=False, reply_bytes=False):
+    command_metrics.reply_bytes = reply_bytes
+    app.before_request(start_request)
+    app.after_request(
+        lambda response: finish_request(response, server_timing))
@@ -1,5 +1,5 @@
 from pymongo import MongoClient
-from bcrypt import gensalt, hashpw
+from hashing import hashing_service
 
 client = MongoClient("mongodb://127.0.0.1:27017")
 db = client.EDB_DB
@@ -33,6 +33,8 @@ user_list = [
     }
 ]
 
-for user in user_list:
-    user["password"] = hashpw(user["password"], gensalt())
-    users.insert_one(user)
+if __name__ == "__main__":
+    for user in user_list:
+        user["password"] = hashing_service.hash_password(user["password"])
+        users.insert_one(user)
+    hashing_service.shutdown()
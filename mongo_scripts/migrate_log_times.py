@@ -0,0 +1,88 @@
+from argparse import ArgumentParser
+from datetime import datetime, UTC
+from re import compile
+from pymongo import MongoClient, UpdateOne
+from audit import action_messages
+
+client = MongoClient("mongodb://127.0.0.1:27017")
+db = client.EDB_DB
+logs = db.logs
+
+legacy_time_format = "%H:%M:%S, %m/%d/%Y"
+legacy_log_pattern = compile(r"^The user (.+) (\w+ the \w+) (\w+) at (.+)$")
+action_codes = {message: action for action, message in action_messages.items()}
+action_codes["created the planet"] = "add_planet"
+
+
+def convert_action(action):
+    match = legacy_log_pattern.match(action or "")
+    if not match or match.group(2) not in action_codes:
+        return None
+
+    user, message, target_id, _ = match.groups()
+    return {"action": action_codes[message],
+            "target_id": target_id,
+            "message": f"The user {user} {message} {target_id}"}
+
+
+def convert_log(log):
+    time = datetime.strptime(log["time"], legacy_time_format)
+    fields = {"time": time.astimezone(UTC)}
+    fields.update(convert_action(log.get("action")) or {})
+    return fields
+
+
+def migrate(batch_size):
+    last_id = None
+    converted = 0
+    skipped = 0
+    unmatched = []
+
+    while True:
+        query = {"$or": [{"time": {"$type": "string"}},
+                         {"action": legacy_log_pattern}]}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        batch = list(logs.find(query, {"time": 1, "action": 1}).sort(
+            "_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        updates = []
+        for log in batch:
+            try:
+                if isinstance(log["time"], str):
+                    fields = convert_log(log)
+                else:
+                    fields = convert_action(log.get("action")) or {}
+            except ValueError:
+                skipped += 1
+                continue
+            if "target_id" not in fields:
+                unmatched.append(log["_id"])
+            if fields:
+                updates.append(UpdateOne({"_id": log["_id"]},
+                                         {"$set": fields}))
+
+        if updates:
+            converted += logs.bulk_write(updates, ordered=False).modified_count
+        last_id = batch[-1]["_id"]
+
+    return converted, skipped, unmatched
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Convert string log timestamps to BSON datetimes")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    converted, skipped, unmatched = migrate(args.batch_size)
+    for l_id in unmatched:
+        print(f"{l_id}: action not recognised")
+    print(f"{converted} logs converted, {skipped} skipped, "
+          f"{len(unmatched)} with unrecognised actions")
+    if converted:
+        print("Run python stats.py to rebuild the log counters")
+    client.close()
@@ -0,0 +1,106 @@
+from argparse import ArgumentParser
+from pymongo import MongoClient, ReplaceOne, DeleteOne, UpdateOne
+
+client = MongoClient("mongodb://127.0.0.1:27017")
+db = client.EDB_DB
+bodies = db.bodies
+planets = db.planets
+
+
+def star_batches(query, batch_size):
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        stars = list(bodies.find(batch_query, {"planets": 1}).sort(
+            "_id", 1).limit(batch_size))
+        if not stars:
+            return
+        yield stars
+        last_id = stars[-1]["_id"]
+
+
+def copy_planets(stars):
+    writes = [ReplaceOne({"_id": planet["_id"]},
+                         {**planet, "star_id": star["_id"]}, upsert=True)
+              for star in stars for planet in star.get("planets", [])]
+    if writes:
+        planets.bulk_write(writes, ordered=False)
+    return len(writes)
+
+
+def planet_statuses(star_planets):
+    return sorted({planet["status"] for planet in star_planets
+                   if planet.get("status") is not None})
+
+
+def migrate(batch_size):
+    copied_stars, copied_planets = 0, 0
+    for stars in star_batches({"planets_migrated": {"$ne": True}},
+                              batch_size):
+        copied_planets += copy_planets(stars)
+        bodies.bulk_write([UpdateOne({"_id": star["_id"]}, {"$set": {
+            "planets_migrated": True,
+            "planet_statuses": planet_statuses(star.get("planets", []))}})
+            for star in stars], ordered=False)
+        copied_stars += len(stars)
+    return copied_stars, copied_planets
+
+
+def verify(batch_size, repair):
+    mismatched = 0
+    for stars in star_batches({"planets_migrated": True}, batch_size):
+        stored = {}
+        for planet in planets.find(
+                {"star_id": {"$in": [star["_id"] for star in stars]}}):
+            stored[planet.pop("_id")] = planet
+
+        writes = []
+        for star in stars:
+            for planet in star.get("planets", []):
+                expected = {**planet, "star_id": star["_id"]}
+                actual = stored.pop(planet["_id"], None)
+                if actual is None or {"_id": planet["_id"], **actual} \
+                        != expected:
+                    writes.append(ReplaceOne({"_id": planet["_id"]},
+                                             expected, upsert=True))
+        writes.extend(DeleteOne({"_id": p_id}) for p_id in stored)
+
+        mismatched += len(writes)
+        if repair and writes:
+            planets.bulk_write(writes, ordered=False)
+    return mismatched
+
+
+def drop_embedded():
+    return bodies.update_many({"planets": {"$exists": True}}, [
+        {"$set": {"planet_statuses": {
+            "$setUnion": [{"$ifNull": ["$planets.status", []]}]}}},
+        {"$unset": ["planets", "planets_migrated"]}
+    ]).modified_count
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Copy embedded planets into the planets collection")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--verify", action="store_true",
+                        help="compare migrated stars with the collection")
+    parser.add_argument("--repair", action="store_true",
+                        help="with --verify, rewrite mismatched planets")
+    parser.add_argument("--drop-embedded", action="store_true",
+                        help="remove embedded planets once reads and writes "
+                             "use planet_storage = \"collection\"")
+    args = parser.parse_args()
+
+    if args.drop_embedded:
+        print(f"{drop_embedded()} stars cleared")
+    elif args.verify:
+        mismatched = verify(args.batch_size, args.repair)
+        outcome = "repaired" if args.repair else "differ"
+        print(f"{mismatched} planets {outcome}")
+    else:
+        stars, copied = migrate(args.batch_size)
+        print(f"{copied} planets copied from {stars} stars")
+    client.close()
@@ -1,83 +1,219 @@
-from pymongo import MongoClient
-from random import randint, uniform, choice
-from datetime import datetime
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, UTC
+from glob import glob
+from os import cpu_count, makedirs, path
+from random import Random
+from struct import pack
+from bson import json_util
 from bson.objectid import ObjectId
+from pymongo import MongoClient
+from globals import planet_storage
 
-client = MongoClient("mongodb://127.0.0.1:27017")
-db = client.EDB_DB
-bodies = db.bodies
-logs = db.logs
+mongo_uri = "mongodb://127.0.0.1:27017"
 
 usernames = ["starlord34", "stargal21", "galaxycrusher59"]
 spectra = ["O", "B", "A", "F", "G", "K", "M"]
 statuses = ["confirmed", "candidate", "disproven"]
 planet_identifiers = ["b", "c", "d", "e", "f", "g", "h", "i"]
 
-bodies_list = []
+base_timestamp = int(datetime(2024, 1, 1, tzinfo=UTC).timestamp())
+
+db = None
+
 
+def object_id(rng, position):
+    return ObjectId(pack(">I", base_timestamp + position) + rng.randbytes(8))
 
-def generate_star():
-    star_name = "HIP " + str(randint(1, 50000))
+
+def generate_star(rng, position):
+    star_name = "HIP " + str(rng.randint(1, 50000))
     return {
+        "_id": object_id(rng, position),
         "name": star_name,
         "type": "star",
-        "radius": randint(200000, 5000000),
-        "mass": round(uniform(0.05, 3), 2),
-        "density": round(uniform(1, 3), 2),
-        "surface_temperature": randint(3000, 10000),
-        "distance": round(uniform(5, 250), 1),
-        "spectral_classification": choice(spectra),
-        "apparent_magnitude": round(uniform(-1, 8), 2),
-        "absolute_magnitude": round(uniform(-1, 8), 2),
-        "planets": [generate_planet(star_name, identifier)
-                    for identifier in planet_identifiers[:randint(0, 9)]]
+        "radius": rng.randint(200000, 5000000),
+        "mass": round(rng.uniform(0.05, 3), 2),
+        "density": round(rng.uniform(1, 3), 2),
+        "surface_temperature": rng.randint(3000, 10000),
+        "distance": round(rng.uniform(5, 250), 1),
+        "spectral_classification": rng.choice(spectra),
+        "apparent_magnitude": round(rng.uniform(-1, 8), 2),
+        "absolute_magnitude": round(rng.uniform(-1, 8), 2),
+        "planets": [generate_planet(rng, position, star_name, identifier)
+                    for identifier in
+                    planet_identifiers[:rng.randint(0, 9)]]
     }
 
 
-def generate_planet(star_name, identifier):
+def generate_planet(rng, position, star_name, identifier):
     apoapsis, periapsis = sorted((
-        randint(4000000, 1000000000),
-        randint(4000000, 1000000000)), reverse=True)
+        rng.randint(4000000, 1000000000),
+        rng.randint(4000000, 1000000000)), reverse=True)
 
     eccentricity = (apoapsis - periapsis) / (apoapsis + periapsis)
     eccentricity = round(eccentricity, 2)
 
-    username = choice(usernames)
-
-    p_id = ObjectId()
-    time = datetime.now().strftime("%H:%M:%S, %m/%d/%Y")
-    log = f"The user {username} created the planet {p_id} at {time}"
-    logs.insert_one({"user": username, "time": time, "action": log})
-
     return {
-        "_id": p_id,
+        "_id": object_id(rng, position),
         "name": star_name + " " + identifier,
         "type": "planet",
-        "radius": randint(2000, 80000),
-        "mass": round(uniform(0.1, 500), 2),
-        "density": round(uniform(0.5, 7), 2),
-        "surface_temperature": randint(100, 1000),
+        "radius": rng.randint(2000, 80000),
+        "mass": round(rng.uniform(0.1, 500), 2),
+        "density": round(rng.uniform(0.5, 7), 2),
+        "surface_temperature": rng.randint(100, 1000),
         "apoapsis": apoapsis,
         "periapsis": periapsis,
         "eccentricity": eccentricity,
-        "orbital_period": randint(1, 2000),
-        "status": choice(statuses),
-        "num_moons": randint(0, 20),
-        "contributed_by": username
+        "orbital_period": rng.randint(1, 2000),
+        "status": rng.choice(statuses),
+        "num_moons": rng.randint(0, 20),
+        "contributed_by": rng.choice(usernames)
     }
 
 
-def generate_data(num_stars):
-    for i in range(num_stars):
-        bodies_list.append(generate_star())
+def generate_batch(seed, start, count):
+    return [generate_star(Random(f"{seed}:{position}"), position)
+            for position in range(start, start + count)]
+
+
+def generate_logs(stars):
+    entries = []
+    for star in stars:
+        for planet in star["planets"]:
+            username, p_id = planet["contributed_by"], planet["_id"]
+            entries.append({
+                "user": username,
+                "time": p_id.generation_time,
+                "action": "add_planet",
+                "target_id": str(p_id),
+                "message": f"The user {username} added the planet {p_id}"
+            })
+    return entries
+
+
+def storage_documents(stars):
+    star_documents, planet_documents = [], []
+    for star in stars:
+        star = dict(star)
+        star_planets = star.pop("planets")
+        if planet_storage != "collection":
+            star["planets"] = star_planets
+        else:
+            star["planet_statuses"] = sorted(
+                {planet["status"] for planet in star_planets})
+        if planet_storage == "dual":
+            star["planets_migrated"] = True
+        if planet_storage != "embedded":
+            planet_documents.extend({**planet, "star_id": star["_id"]}
+                                    for planet in star_planets)
+        star_documents.append(star)
+    return star_documents, planet_documents
+
+
+def batch_file(output, kind, start):
+    return path.join(output, f"{kind}-{start:012d}.ndjson")
+
+
+def write_ndjson(file_name, documents):
+    with open(file_name, "w", encoding="utf-8") as file:
+        for document in documents:
+            file.write(json_util.dumps(document) + "\n")
+
+
+def open_database():
+    global db
+    db = MongoClient(mongo_uri).EDB_DB
+
+
+def seed_batch(seed, start, count, output):
+    stars = generate_batch(seed, start, count)
+
+    if output:
+        write_ndjson(batch_file(output, "bodies", start), stars)
+        return len(stars)
+
+    star_documents, planet_documents = storage_documents(stars)
+    db.bodies.insert_many(star_documents, ordered=False)
+    if planet_documents:
+        db.planets.insert_many(planet_documents, ordered=False)
+    return len(stars)
+
+
+def seed_logs_batch(seed, start, count, output):
+    entries = generate_logs(generate_batch(seed, start, count))
+
+    if output:
+        write_ndjson(batch_file(output, "logs", start), entries)
+    elif entries:
+        db.logs.insert_many(entries, ordered=False)
+    return len(entries)
+
+
+def replay_file(file_name):
+    collection = path.basename(file_name).split("-")[0]
+    with open(file_name, encoding="utf-8") as file:
+        documents = [json_util.loads(line) for line in file if line.strip()]
+
+    if collection == "bodies":
+        star_documents, planet_documents = storage_documents(documents)
+        db.bodies.insert_many(star_documents, ordered=False)
+        if planet_documents:
+            db.planets.insert_many(planet_documents, ordered=False)
+    elif documents:
+        db.logs.insert_many(documents, ordered=False)
+    return len(documents)
+
 
+def replay(directory, workers):
+    file_names = sorted(glob(path.join(directory, "bodies-*.ndjson")))
+    file_names += sorted(glob(path.join(directory, "logs-*.ndjson")))
 
-def seed_data():
-    for body in bodies_list:
-        bodies.insert_one(body)
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=open_database) as executor:
+        return sum(executor.map(replay_file, file_names))
+
+
+def run_batches(task, args):
+    batches = [(start, min(args.batch_size, args.stars - start))
+               for start in range(0, args.stars, args.batch_size)]
+    total = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers,
+                             initializer=open_database) as executor:
+        futures = [executor.submit(task, args.seed, start, count,
+                                   args.output)
+                   for start, count in batches]
+        for future in futures:
+            total += future.result()
+    return total
 
 
 if __name__ == "__main__":
-    generate_data(150)
-    seed_data()
-    client.close()
+    parser = ArgumentParser(
+        description="Generate a deterministic synthetic star catalogue")
+    parser.add_argument("--stars", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--no-logs", action="store_true",
+                        help="skip the add_planet log entries")
+    parser.add_argument("--output",
+                        help="write NDJSON files to this directory instead "
+                             "of inserting into the database")
+    parser.add_argument("--replay",
+                        help="insert NDJSON files previously written with "
+                             "--output")
+    args = parser.parse_args()
+
+    if args.replay:
+        print(f"Replayed {replay(args.replay, args.workers)} documents")
+        exit(0)
+
+    if args.output:
+        makedirs(args.output, exist_ok=True)
+
+    print(f"Seeded {run_batches(seed_batch, args)} stars")
+
+    if not args.no_logs:
+        print(f"Seeded {run_batches(seed_logs_batch, args)} logs")
@@ -0,0 +1,46 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from datetime import datetime
+from urllib.parse import urlencode
+from bson import ObjectId, json_util
+from bson.errors import BSONError
+from flask import request
+
+cursor_types = (int, float, str, datetime, ObjectId, type(None))
+
+
+def encode_cursor(values):
+    raw = json_util.dumps(list(values)).encode("utf-8")
+    return urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, num_values):
+    padding = "=" * (-len(cursor) % 4)
+    try:
+        values = json_util.loads(urlsafe_b64decode(cursor + padding))
+    except (Base64Error, ValueError, TypeError, LookupError, BSONError):
+        return None
+    if not isinstance(values, list) or len(values) != num_values:
+        return None
+    if not all(isinstance(value, cursor_types) for value in values):
+        return None
+    return values
+
+
+def keyset_filter(sort_keys, values):
+    clauses = []
+    for i, (field, direction) in enumerate(sort_keys):
+        clause = {prev_field: values[j]
+                  for j, (prev_field, _) in enumerate(sort_keys[:i])}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def add_next_link(response, values):
+    args = request.args.to_dict()
+    args.pop("pn", None)
+    args["after"] = encode_cursor(values)
+    response.headers["Link"] = \
+        f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
@@ -0,0 +1,155 @@
+from collections import deque
+from cProfile import Profile
+from functools import wraps
+from pstats import Stats
+from threading import Lock
+from time import monotonic
+from flask import g, jsonify, make_response, request
+from pymongo.errors import PyMongoError
+from decorators import jwt_required, admin_required
+from globals import (client, profile_rate_limit, profile_rate_window_seconds,
+                     profile_top_functions, profile_max_explains)
+
+explainable_commands = {"find", "aggregate", "count", "distinct"}
+session_fields = {"lsid", "txnNumber", "autocommit", "startTransaction"}
+
+
+class RateLimiter:
+    def __init__(self, limit, window_seconds):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.calls = deque()
+        self.lock = Lock()
+
+    def acquire(self):
+        now = monotonic()
+        with self.lock:
+            while self.calls and self.calls[0] <= now - self.window_seconds:
+                self.calls.popleft()
+            if len(self.calls) >= self.limit:
+                return self.calls[0] + self.window_seconds - now
+            self.calls.append(now)
+            return 0
+
+
+profile_limiter = RateLimiter(profile_rate_limit, profile_rate_window_seconds)
+profiler_lock = Lock()
+
+
+def top_functions(profiler):
+    stats = Stats(profiler).sort_stats("cumulative")
+    functions = []
+    for function in stats.fcn_list[:profile_top_functions]:
+        file_name, line, name = function
+        _, calls, total, cumulative, _ = stats.stats[function]
+        functions.append({
+            "function": f"{file_name}:{line}({name})",
+            "calls": calls,
+            "total_seconds": round(total, 6),
+            "cumulative_seconds": round(cumulative, 6)
+        })
+    return functions
+
+
+def find_values(document, key):
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            else:
+                yield from find_values(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from find_values(value, key)
+
+
+def explain(database_name, command_name, command):
+    command = {key: value for key, value in command.items()
+               if not key.startswith("$") and key not in session_fields}
+    try:
+        result = client[database_name].command(
+            {"explain": command, "verbosity": "executionStats"})
+    except PyMongoError as error:
+        return {"command": command_name, "error": str(error)}
+
+    execution = next(find_values(result, "executionStats"), {})
+    return {
+        "command": command_name,
+        "collection": command.get(command_name),
+        "docs_examined": execution.get("totalDocsExamined"),
+        "keys_examined": execution.get("totalKeysExamined"),
+        "returned": execution.get("nReturned"),
+        "execution_ms": execution.get("executionTimeMillis"),
+        "indexes": sorted(set(find_values(result, "indexName")))
+    }
+
+
+def too_many_profiles(retry_after):
+    response = make_response(
+        jsonify({"error": "profiling rate limit reached"}), 429)
+    response.headers["Retry-After"] = str(int(retry_after) + 1)
+    return response
+
+
+def profiled(view):
+    @jwt_required
+    @admin_required
+    def profiled_view(*args, **kwargs):
+        retry_after = profile_limiter.acquire()
+        if retry_after:
+            return too_many_profiles(retry_after)
+        if not profiler_lock.acquire(blocking=False):
+            return too_many_profiles(0)
+
+        g.profiling = True
+        g.captured_commands = []
+        profiler = Profile()
+        try:
+            profiler.enable()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                profiler.disable()
+        finally:
+            profiler_lock.release()
+            commands, g.captured_commands = g.captured_commands, None
+
+        reads = [command for command in commands
+                 if command[1] in explainable_commands]
+        queries = [explain(*command)
+                   for command in reads[:profile_max_explains]]
+
+        data = None
+        if not response.is_streamed:
+            data = response.get_json(silent=True)
+            if data is None:
+                data = response.get_data(as_text=True)
+
+        return make_response(jsonify({
+            "data": data,
+            "profile": {
+                "functions": top_functions(profiler),
+                "commands": len(commands),
+                "queries": queries
+            }
+        }), response.status_code)
+
+    return profiled_view
+
+
+def with_profile_switch(view):
+    profiled_view = profiled(view)
+
+    @wraps(view)
+    def profile_switch(*args, **kwargs):
+        if request.args.get("profile") == "1":
+            return profiled_view(*args, **kwargs)
+        return view(*args, **kwargs)
+    return profile_switch
+
+
+def init_profiling(app):
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint == "static":
+            continue
+        app.view_functions[endpoint] = with_profile_switch(view)
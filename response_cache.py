@@ -0,0 +1,203 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, UTC
+from functools import wraps
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlencode
+from flask import Response, g, make_response, request
+from pymongo import UpdateOne
+from globals import (db, response_cache_backend, response_cache_ttl_seconds,
+                     response_cache_max_bytes)
+
+
+class MemoryBackend:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.size = 0
+        self.evictions = 0
+        self.generation = 0
+        self.lock = Lock()
+
+    def get(self, key, tags):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None, self.generation
+            if entry["expires_at"] <= monotonic():
+                self.remove(key)
+                self.evictions += 1
+                return None, self.generation
+            self.entries.move_to_end(key)
+            return entry, self.generation
+
+    def set(self, key, entry, tags, ttl_seconds, generation):
+        if len(entry["body"]) > self.max_bytes:
+            return
+        entry = {**entry, "tags": tags,
+                 "expires_at": monotonic() + ttl_seconds}
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.remove(key)
+            self.entries[key] = entry
+            self.size += len(entry["body"])
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= len(entry["body"])
+        for tag in entry["tags"]:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def invalidate(self, tags):
+        with self.lock:
+            self.generation += 1
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self.remove(key)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size,
+                    "evictions": self.evictions}
+
+
+class MongoBackend:
+    def __init__(self, collection, ttl_seconds):
+        self.collection = collection
+        self.generation_ttl = timedelta(seconds=ttl_seconds) + \
+            timedelta(hours=1)
+
+    def get(self, key, tags):
+        documents = self.collection.find({"_id": {
+            "$in": [key] + [generation_id(tag) for tag in tags]}})
+        entry = None
+        generations = []
+        for document in documents:
+            if document["_id"] == key:
+                entry = document
+            else:
+                generations.append([document["tag"],
+                                    document["generation"]])
+        generations.sort()
+
+        if entry is not None and (
+                entry["expires_at"].replace(tzinfo=UTC) <= datetime.now(UTC)
+                or entry.get("generations") != generations):
+            entry = None
+        return entry, generations
+
+    def set(self, key, entry, tags, ttl_seconds, generations):
+        self.collection.replace_one({"_id": key}, {
+            **entry, "tags": tags, "generations": generations,
+            "expires_at": datetime.now(UTC) + timedelta(seconds=ttl_seconds)
+        }, upsert=True)
+
+    def invalidate(self, tags):
+        self.collection.bulk_write([UpdateOne(
+            {"_id": generation_id(tag)},
+            {"$set": {"tag": tag, "expires_at":
+                      datetime.now(UTC) + self.generation_ttl},
+             "$inc": {"generation": 1}}, upsert=True) for tag in tags],
+            ordered=False)
+        self.collection.delete_many({"tags": {"$in": tags}})
+
+    def stats(self):
+        return {"entries": self.collection.count_documents(
+                    {"tags": {"$exists": True}}),
+                "evictions": None}
+
+
+def generation_id(tag):
+    return f"generation:{tag}"
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl_seconds):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def cached(self, *tag_templates):
+        def decorator(func):
+            @wraps(func)
+            def cached_wrapper(*args, **kwargs):
+                if self.backend is None or g.get("profiling"):
+                    return func(*args, **kwargs)
+
+                key = cache_key()
+                tags = [template.format(**kwargs).lower()
+                        for template in tag_templates]
+                entry, generation = self.backend.get(key, tags)
+                if entry is not None:
+                    self.count("hits")
+                    return Response(entry["body"], status=entry["status"],
+                                    headers=entry["headers"])
+
+                self.count("misses")
+                response = make_response(func(*args, **kwargs))
+
+                if response.status_code == 200 and not response.is_streamed:
+                    self.backend.set(key, {
+                        "body": response.get_data(),
+                        "status": response.status_code,
+                        "headers": [(name, value) for name, value
+                                    in response.headers.items()
+                                    if name != "Content-Length"]
+                    }, tags, self.ttl_seconds, generation)
+
+                return response
+            return cached_wrapper
+        return decorator
+
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        self.backend.invalidate([tag.lower() for tag in tags])
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses}
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+
+def request_key():
+    args = sorted(request.args.items(multi=True))
+    return f"{request.path}?{urlencode(args)}"
+
+
+def cache_key():
+    if g.get("star_version") is not None:
+        return f"{request_key()}#{g.star_version}"
+    return request_key()
+
+
+def create_backend(name):
+    if name == "memory":
+        return MemoryBackend(response_cache_max_bytes)
+    if name == "mongo":
+        return MongoBackend(db.response_cache, response_cache_ttl_seconds)
+    return None
+
+
+response_cache = ResponseCache(create_backend(response_cache_backend),
+                               response_cache_ttl_seconds)
@@ -0,0 +1,222 @@
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime, timedelta, UTC
+from gzip import open as gzip_open
+from os import makedirs, path, replace
+from shutil import rmtree
+from bson import json_util
+from globals import (db, log_retention_days, log_archive_dir,
+                     retention_batch_size)
+from pagination import keyset_filter
+
+logs = db.logs
+log_rollups = db.log_rollups
+retention = db.retention
+
+sort_keys = [("time", 1), ("_id", 1)]
+
+
+def start_of_day(time):
+    return time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def read_watermark():
+    state = retention.find_one({"_id": "logs"}) or {}
+    return state.get("watermark")
+
+
+def day_directory(day):
+    return path.join(log_archive_dir, day.strftime("%Y-%m-%d"))
+
+
+def write_archive(day, part, batch):
+    directory = day_directory(day)
+    makedirs(directory, exist_ok=True)
+    file_name = path.join(directory, f"{part}.ndjson.gz")
+    with gzip_open(file_name + ".tmp", "wt", encoding="utf-8") as file:
+        for entry in batch:
+            file.write(json_util.dumps(entry) + "\n")
+    replace(file_name + ".tmp", file_name)
+
+
+def write_rollups(day, part, batch):
+    counts = Counter((entry["user"], entry.get("action")) for entry in batch)
+    log_rollups.delete_many({"part": part})
+    log_rollups.insert_many([
+        {"_id": f"{part}|{user}|{action}", "part": part, "day": day,
+         "user": user, "action": action, "count": count}
+        for (user, action), count in counts.items()])
+
+
+def read_archive(file_name):
+    with gzip_open(file_name, "rt", encoding="utf-8") as file:
+        return [json_util.loads(line) for line in file]
+
+
+def delete_archived(day, part):
+    retention.update_one({"_id": "logs"}, {"$set": {
+        "pending": {"day": day, "part": part}}}, upsert=True)
+    archived = read_archive(path.join(day_directory(day),
+                                      f"{part}.ndjson.gz"))
+    logs.delete_many({"_id": {"$in": [entry["_id"] for entry in archived]}})
+    retention.update_one({"_id": "logs"}, {"$unset": {"pending": ""}})
+
+
+def finish_pending():
+    state = retention.find_one({"_id": "logs"}) or {}
+    if "pending" in state:
+        delete_archived(state["pending"]["day"], state["pending"]["part"])
+
+
+def archive_day(day, batch_size):
+    archived = 0
+    while True:
+        batch = list(logs.find(
+            {"time": {"$gte": day, "$lt": day + timedelta(days=1)}}).sort(
+            sort_keys).limit(batch_size))
+        if not batch:
+            return archived
+        part = batch[0]["_id"]
+        write_archive(day, part, batch)
+        write_rollups(day, part, batch)
+        delete_archived(day, part)
+        archived += len(batch)
+
+
+def apply_retention(days=log_retention_days,
+                    batch_size=retention_batch_size, dry_run=False):
+    cutoff = start_of_day(datetime.now(UTC) - timedelta(days=days))
+    cutoff = cutoff.replace(tzinfo=None)
+    if not dry_run:
+        finish_pending()
+    oldest = logs.find_one({"time": {"$lt": cutoff}}, {"time": 1},
+                           sort=sort_keys)
+    archived = {}
+
+    if oldest is not None:
+        day = start_of_day(oldest["time"])
+        while day < cutoff:
+            if dry_run:
+                count = logs.count_documents(
+                    {"time": {"$gte": day, "$lt": day + timedelta(days=1)}})
+            else:
+                count = archive_day(day, batch_size)
+            if count:
+                archived[day.strftime("%Y-%m-%d")] = count
+            day += timedelta(days=1)
+
+    if not dry_run:
+        watermark = read_watermark()
+        if watermark is None or watermark < cutoff:
+            retention.update_one({"_id": "logs"},
+                                 {"$set": {"watermark": cutoff}}, upsert=True)
+    return archived
+
+
+def archive_parts(query=None, since=None):
+    query = query or {}
+    rollup_filter = {field: query[field] for field in ("user", "action")
+                     if field in query}
+    day_range = {}
+    if since is not None:
+        day_range["$gte"] = start_of_day(since)
+    if "$lt" in query.get("time", {}):
+        day_range["$lt"] = query["time"]["$lt"]
+    if day_range:
+        rollup_filter["day"] = day_range
+    return sorted({(rollup["day"], rollup["part"]) for rollup in
+                   log_rollups.find(rollup_filter, {"day": 1, "part": 1})})
+
+
+def part_file(day, part):
+    return path.join(day_directory(day), f"{part}.ndjson.gz")
+
+
+def matches(entry, query, after):
+    for field in ("user", "action"):
+        if field in query and entry.get(field) != query[field]:
+            return False
+    time_range = query.get("time", {})
+    if "$gte" in time_range and entry["time"] < time_range["$gte"]:
+        return False
+    if "$lt" in time_range and entry["time"] >= time_range["$lt"]:
+        return False
+    if after is not None and (entry["time"], entry["_id"]) <= tuple(after):
+        return False
+    return True
+
+
+def read_archives(query, after, since, limit):
+    found = []
+    current_day = None
+    for day, part in archive_parts(query, since):
+        if day != current_day and len(found) >= limit:
+            break
+        current_day = day
+        found.extend(entry for entry in read_archive(part_file(day, part))
+                     if matches(entry, query, after))
+    found.sort(key=lambda entry: (entry["time"], entry["_id"]))
+    return found[:limit]
+
+
+def archived_logs():
+    for day, part in archive_parts():
+        yield from read_archive(part_file(day, part))
+
+
+def reaches_archive(since, until, watermark):
+    if watermark is None:
+        return False
+    return (since is not None and since < watermark) or \
+        (until is not None and until <= watermark)
+
+
+def find_logs(query, after, skip, limit):
+    since = query.get("time", {}).get("$gte")
+    if after is not None and (since is None or after[0] > since):
+        since = after[0]
+    until = query.get("time", {}).get("$lt")
+    if after is not None:
+        raw_query = {**query, **keyset_filter(sort_keys, after)}
+    else:
+        raw_query = query
+
+    if not reaches_archive(since, until, read_watermark()):
+        return list(logs.find(raw_query).sort(sort_keys).skip(skip).limit(
+            limit))
+
+    archived = read_archives(query, after, since, skip + limit)
+    found = archived[skip:]
+    if len(found) < limit:
+        found.extend(logs.find(raw_query).sort(sort_keys).skip(
+            max(0, skip - len(archived))).limit(limit - len(found)))
+    return found
+
+
+def count_archived():
+    totals = list(log_rollups.aggregate([
+        {"$group": {"_id": None, "count": {"$sum": "$count"}}}]))
+    return totals[0]["count"] if totals else 0
+
+
+def clear_archives():
+    log_rollups.delete_many({})
+    retention.delete_one({"_id": "logs"})
+    rmtree(log_archive_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Archive and roll up logs older than the retention "
+                    "period")
+    parser.add_argument("--days", type=int, default=log_retention_days)
+    parser.add_argument("--batch-size", type=int,
+                        default=retention_batch_size)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report what would be archived")
+    args = parser.parse_args()
+
+    archived = apply_retention(args.days, args.batch_size, args.dry_run)
+    for day, count in archived.items():
+        print(f"{day}: {count} logs")
+    print(f"{sum(archived.values())} logs archived")
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, UTC
+from threading import Lock, Thread
+from time import sleep
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from globals import db, revocation_refresh_seconds, revocation_max_entries
+
+blacklist = db.blacklist
+
+watermark_overlap = timedelta(seconds=5)
+
+
+class RevocationCache:
+    def __init__(self, collection, refresh_seconds, max_entries):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self.max_entries = max_entries
+        self.revoked = {}
+        self.watermark = None
+        self.ready = False
+        self.overflowed = False
+        self.started = False
+        self.lock = Lock()
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except PyMongoError:
+                pass
+            sleep(self.refresh_seconds)
+
+    def refresh(self):
+        now = datetime.now(UTC)
+        if self.overflowed:
+            if self.collection.count_documents(
+                    {"exp": {"$gt": now}}) > self.max_entries:
+                return
+            with self.lock:
+                self.revoked.clear()
+                self.watermark = None
+                self.overflowed = False
+
+        if self.watermark is None:
+            query = {"exp": {"$gt": now}}
+        else:
+            query = {"_id": {"$gt": ObjectId.from_datetime(
+                self.watermark - watermark_overlap)}}
+
+        entries = self.collection.find(
+            query, {"jti": 1, "exp": 1}).sort("_id", 1)
+
+        with self.lock:
+            for entry in entries:
+                if "jti" not in entry:
+                    continue
+                self.revoked[entry["jti"]] = entry["exp"].replace(tzinfo=UTC)
+                self.watermark = entry["_id"].generation_time
+            self.revoked = {jti: exp for jti, exp in self.revoked.items()
+                            if exp > now}
+            if len(self.revoked) > self.max_entries:
+                self.revoked.clear()
+                self.overflowed = True
+            if self.watermark is None:
+                self.watermark = now
+            self.ready = True
+
+    def is_revoked(self, jti):
+        self.start()
+        if not self.ready or self.overflowed:
+            return self.collection.find_one({"jti": jti}, {"_id": 1}) \
+                is not None
+        return jti in self.revoked
+
+    def revoke(self, jti, exp):
+        exp = datetime.fromtimestamp(exp, UTC)
+        try:
+            self.collection.insert_one({"jti": jti, "exp": exp})
+        except DuplicateKeyError:
+            pass
+        with self.lock:
+            self.revoked[jti] = exp
+
+
+revocations = RevocationCache(
+    blacklist, revocation_refresh_seconds, revocation_max_entries)
@@ -0,0 +1,48 @@
+star_fields = {
+    "name": str,
+    "radius": int,
+    "mass": float,
+    "density": float,
+    "surface_temperature": int,
+    "distance": int,
+    "spectral_classification": str,
+    "apparent_magnitude": float,
+    "absolute_magnitude": float
+}
+
+planet_fields = {
+    "name": str,
+    "radius": int,
+    "mass": float,
+    "density": float,
+    "surface_temperature": int,
+    "apoapsis": int,
+    "periapsis": int,
+    "eccentricity": float,
+    "orbital_period": int,
+    "status": str,
+    "num_moons": int
+}
+
+
+def missing_fields(source, fields):
+    return [field for field in fields if source.get(field) in (None, "")]
+
+
+def convert_fields(source, fields):
+    converted = {}
+    for field, convert in fields.items():
+        try:
+            converted[field] = convert(source[field])
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid value for {field}")
+    return converted
+
+
+def build_star(source):
+    return {**convert_fields(source, star_fields), "type": "star"}
+
+
+def build_planet(source, contributor):
+    return {**convert_fields(source, planet_fields), "type": "planet",
+            "contributed_by": contributor}
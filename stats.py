@@ -0,0 +1,256 @@
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime, timedelta, UTC
+from itertools import chain
+from pymongo import UpdateOne, DeleteOne
+from globals import (db, planet_storage, activity_windows,
+                     activity_bucket_ttl_seconds)
+
+stats = db.stats
+bodies = db.bodies
+planets = db.planets
+logs = db.logs
+log_rollups = db.log_rollups
+activity_buckets = db.activity_buckets
+
+log_actions_prefix = "log_actions:"
+
+
+def planet_changes(planets, sign):
+    changes = Counter()
+    for planet in planets:
+        changes["planets"] += sign
+        changes[f"planets_status:{planet.get('status')}"] += sign
+        changes[f"planets_contributor:{planet.get('contributed_by')}"] += sign
+    return changes
+
+
+def increment(changes):
+    updates = [UpdateOne({"_id": counter_id}, {"$inc": {"count": amount}},
+                         upsert=True)
+               for counter_id, amount in changes.items() if amount]
+    if updates:
+        stats.bulk_write(updates, ordered=False)
+
+
+def record_logs(entries, sign=1):
+    changes = Counter((entry["user"], entry.get("action"))
+                      for entry in entries)
+    updates = [UpdateOne({"_id": f"{log_actions_prefix}{user}"}, {
+        "$set": {"user": user},
+        "$inc": {"count": sign * amount,
+                 f"actions.{action}": sign * amount}}, upsert=True)
+        for (user, action), amount in changes.items()]
+    if updates:
+        stats.bulk_write(updates, ordered=False)
+    record_activity(entries, sign)
+
+
+def start_of_hour(time):
+    if time.tzinfo is not None:
+        time = time.astimezone(UTC).replace(tzinfo=None)
+    return time.replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_id(hour, user, action):
+    return f"{hour:%Y-%m-%dT%H}|{action}|{user}"
+
+
+def record_activity(entries, sign=1):
+    changes = Counter((start_of_hour(entry["time"]), entry["user"],
+                       entry.get("action"))
+                      for entry in entries
+                      if isinstance(entry.get("time"), datetime))
+    updates = [UpdateOne({"_id": bucket_id(hour, user, action)}, {
+        "$set": {"hour": hour, "user": user, "action": action},
+        "$inc": {"count": sign * amount}}, upsert=True)
+        for (hour, user, action), amount in changes.items()]
+    if updates:
+        activity_buckets.bulk_write(updates, ordered=False)
+
+
+def log_groups(match, count="$count", hour=False):
+    group_id = {"user": "$user", "action": "$action"}
+    if hour:
+        group_id["hour"] = {"$dateFromParts": {
+            "year": {"$year": "$time"}, "month": {"$month": "$time"},
+            "day": {"$dayOfMonth": "$time"}, "hour": {"$hour": "$time"}}}
+    return [{"$match": match},
+            {"$group": {"_id": group_id, "count": {"$sum": count}}}]
+
+
+def read_activity(window, top=None):
+    since = datetime.now(UTC).replace(tzinfo=None) - \
+        timedelta(hours=activity_windows[window])
+    first_bucket = start_of_hour(since) + timedelta(hours=1)
+    groups = chain(
+        logs.aggregate(log_groups(
+            {"time": {"$gte": since, "$lt": first_bucket}}, 1)),
+        activity_buckets.aggregate(log_groups(
+            {"hour": {"$gte": first_bucket}})))
+
+    users = {}
+    for group in groups:
+        user = group["_id"]["user"]
+        action = group["_id"].get("action")
+        activity = users.setdefault(user, {"user": user, "count": 0,
+                                           "actions": {}})
+        activity["count"] += group["count"]
+        activity["actions"][action] = \
+            activity["actions"].get(action, 0) + group["count"]
+
+    ranked = sorted((activity for activity in users.values()
+                     if activity["count"] > 0),
+                    key=lambda activity: (-activity["count"],
+                                          activity["user"]))
+    return since, ranked[:top] if top is not None else ranked
+
+
+def rebuild_activity(apply=True):
+    since = start_of_hour(datetime.now(UTC) -
+                          timedelta(seconds=activity_bucket_ttl_seconds))
+    actual = {}
+    for group in logs.aggregate(log_groups({"time": {"$gte": since}}, 1,
+                                           hour=True)):
+        hour, user = group["_id"]["hour"], group["_id"]["user"]
+        action = group["_id"].get("action")
+        actual[bucket_id(hour, user, action)] = {
+            "hour": hour, "user": user, "action": action,
+            "count": group["count"]}
+    stored = {bucket["_id"]: bucket for bucket in activity_buckets.find(
+        {"hour": {"$gte": since}})}
+
+    drift = {}
+    updates = []
+    for b_id in actual.keys() | stored.keys():
+        expected = actual.get(b_id, {"count": 0})
+        current = stored.get(b_id, {}).get("count", 0)
+        if current != expected["count"]:
+            drift[f"activity:{b_id}"] = {"stored": {"count": current},
+                                         "actual": {"count":
+                                                    expected["count"]}}
+            if b_id in actual:
+                updates.append(UpdateOne({"_id": b_id}, {"$set": expected},
+                                         upsert=True))
+            else:
+                updates.append(DeleteOne({"_id": b_id}))
+
+    if apply and updates:
+        activity_buckets.bulk_write(updates, ordered=False)
+
+    return drift
+
+
+def clear_logs():
+    stats.delete_many({"_id": {"$regex": f"^{log_actions_prefix}"}})
+
+
+def rollup_groups():
+    return log_rollups.aggregate(log_groups({}))
+
+
+def reset_log_counters():
+    clear_logs()
+    activity_buckets.delete_many({})
+
+
+def read_count(counter_id):
+    counter = stats.find_one({"_id": counter_id}, {"count": 1})
+    return counter["count"] if counter is not None else 0
+
+
+def read_log_actions(top=None):
+    counters = stats.find({"_id": {"$regex": f"^{log_actions_prefix}"},
+                           "count": {"$gt": 0}}, {"user": 1, "count": 1,
+                                                  "actions": 1})
+    if top is not None:
+        counters = counters.sort("count", -1).limit(top)
+    return counters
+
+
+def actual_counters():
+    counters = {"stars": bodies.count_documents({"type": "star"})}
+
+    if planet_storage == "collection":
+        planet_groups = planets.aggregate([
+            {"$match": {"type": "planet"}},
+            {"$group": {"_id": {"status": "$status",
+                                "contributor": "$contributed_by"},
+                        "count": {"$sum": 1}}}
+        ])
+    else:
+        planet_groups = bodies.aggregate([
+            {"$match": {"type": "star"}},
+            {"$unwind": "$planets"},
+            {"$match": {"planets.type": "planet"}},
+            {"$group": {"_id": {"status": "$planets.status",
+                                "contributor": "$planets.contributed_by"},
+                        "count": {"$sum": 1}}}
+        ])
+
+    planet_counters = Counter()
+    for group in planet_groups:
+        planet_counters.update(planet_changes([{
+            "status": group["_id"].get("status"),
+            "contributed_by": group["_id"].get("contributor")
+        }], group["count"]))
+    counters.update(planet_counters)
+
+    for group in chain(logs.aggregate(log_groups({}, 1)), rollup_groups()):
+        user = group["_id"]["user"]
+        counter = counters.setdefault(
+            f"{log_actions_prefix}{user}",
+            {"user": user, "count": 0, "actions": {}})
+        counter["count"] += group["count"]
+        action = group["_id"].get("action")
+        counter["actions"][action] = \
+            counter["actions"].get(action, 0) + group["count"]
+
+    return counters
+
+
+def reconcile(apply=True):
+    actual = actual_counters()
+    stored = {counter["_id"]: counter for counter in stats.find()}
+    drift = {}
+    updates = []
+
+    for counter_id in actual.keys() | stored.keys():
+        expected = actual.get(counter_id)
+        if not isinstance(expected, dict):
+            expected = {"count": expected or 0}
+        current = stored.get(counter_id, {})
+        current = {key: current.get(key) for key in expected}
+
+        if current != expected:
+            drift[counter_id] = {"stored": current, "actual": expected}
+            if counter_id in actual:
+                updates.append(UpdateOne({"_id": counter_id},
+                                         {"$set": expected}, upsert=True))
+            else:
+                updates.append(DeleteOne({"_id": counter_id}))
+
+    if apply and updates:
+        stats.bulk_write(updates, ordered=False)
+
+    drift.update(rebuild_activity(apply))
+    return drift
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Rebuild the catalog and log counters and recent "
+                    "activity buckets from scratch")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report drift without rewriting the counters")
+    args = parser.parse_args()
+
+    drift = reconcile(apply=not args.dry_run)
+    buckets = [counter_id for counter_id in drift
+               if counter_id.startswith("activity:")]
+    for counter_id, values in sorted(drift.items()):
+        if counter_id not in buckets:
+            print(f"{counter_id}: stored {values['stored']}, "
+                  f"actual {values['actual']}")
+    print(f"{len(drift) - len(buckets)} counters and {len(buckets)} "
+          "activity buckets drifted")
@@ -0,0 +1,25 @@
+from itertools import chain
+from flask import Response, current_app, request, stream_with_context
+from globals import stream_batch_size
+
+ndjson_mimetype = "application/x-ndjson"
+
+
+def wants_ndjson():
+    if request.args.get("stream") == "1":
+        return True
+    return request.accept_mimetypes.best_match(
+        ["application/json", ndjson_mimetype]) == ndjson_mimetype
+
+
+def ndjson_response(cursor, preceding=()):
+    cursor.batch_size(stream_batch_size)
+
+    def generate():
+        try:
+            for document in chain(preceding, cursor):
+                yield current_app.json.dumps(document) + "\n"
+        finally:
+            cursor.close()
+
+    return Response(stream_with_context(generate()), mimetype=ndjson_mimetype)
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+from time import time
+from globals import claims_cache_max_entries
+
+
+class ClaimsCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, token):
+        key = sha256(token.encode("utf-8")).digest()
+        with self.lock:
+            claims = self.entries.get(key)
+            if claims is not None and claims["exp"] > time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return claims
+            if claims is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        if not isinstance(claims.get("exp"), (int, float)):
+            return
+        key = sha256(token.encode("utf-8")).digest()
+        with self.lock:
+            self.entries[key] = claims
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self.entries)}
+
+
+claims_cache = ClaimsCache(claims_cache_max_entries)